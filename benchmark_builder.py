@@ -0,0 +1,146 @@
+# набор замеров производительности строителей и директора из documented_builder.
+# Запуск: python benchmark_builder.py [--sizes 1000 10000 100000] [--repeat 3] [--output result.json]
+# Результаты (пропускная способность, пиковая память по данным tracemalloc и кривые масштабирования)
+# печатаются в формате JSON
+from argparse import ArgumentParser
+from json import dumps
+from math import log
+from random import Random
+from time import perf_counter
+import tracemalloc
+
+from documented_builder import (Animation, AnimationDirector, StraightAnimationBuilder, RookAnimationBuilder,
+                                ListAnimationBuilder, AnimationLogBuilder)
+
+BUILDERS = (StraightAnimationBuilder, RookAnimationBuilder, ListAnimationBuilder, AnimationLogBuilder)
+QUERIES = 10000
+
+
+# замер лучшего из нескольких запусков по времени и отдельный запуск под tracemalloc для пиковой памяти,
+# чтобы трассировка выделений памяти не искажала замер времени
+def measure(func, repeat):
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        seconds = min(seconds, perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def record(name, size, operations, func, repeat):
+    seconds, peak = measure(func, repeat)
+    return {
+        'name': name,
+        'size': size,
+        'seconds': seconds,
+        'throughput': operations / seconds if seconds else None,
+        'peak_bytes': peak,
+    }
+
+
+# директор строит периодическое движение из size повторений каждым из строителей
+def bench_build_periodic(sizes, repeat):
+    results = []
+    for builder_class in BUILDERS:
+        for size in sizes:
+            def run():
+                director = AnimationDirector()
+                director.builder = builder_class()
+                director.build_periodic(1, 10, -8, size)
+                return director.builder.product
+            results.append(record(f'build_periodic/{builder_class.__name__}', size, 2 * size, run, repeat))
+    return results
+
+
+# директор строит цикл из size точек каждым из строителей
+def bench_build_cycle(sizes, repeat):
+    results = []
+    for builder_class in BUILDERS:
+        for size in sizes:
+            rng = Random(size)
+            points = [(rng.uniform(-100, 100), rng.uniform(-100, 100)) for _ in range(size)]
+
+            def run():
+                director = AnimationDirector()
+                director.builder = builder_class()
+                director.build_cycle(1, *points)
+                return director.builder.product
+            results.append(record(f'build_cycle/{builder_class.__name__}', size, size + 1, run, repeat))
+    return results
+
+
+# определение координат по анимации из size ключевых точек: поштучно и пакетно
+def bench_get_location(sizes, repeat):
+    results = []
+    for size in sizes:
+        animation = Animation()
+        rng = Random(size)
+        for i in range(1, size + 1):
+            animation.add_point(rng.uniform(-100, 100), rng.uniform(-100, 100), i)
+        times = sorted(rng.uniform(0, size) for _ in range(QUERIES))
+        results.append(record('get_location', size, QUERIES,
+                              lambda: [animation.get_location(t) for t in times], repeat))
+        results.append(record('sample', size, QUERIES, lambda: animation.sample(times), repeat))
+    return results
+
+
+# рост текстового журнала из size перемещений
+def bench_log(sizes, repeat):
+    results = []
+    for size in sizes:
+        def run():
+            builder = AnimationLogBuilder()
+            for i in range(size):
+                builder.move_to(i, -i, 1)
+            return builder.product
+        results.append(record('log_builder', size, size, run, repeat))
+    return results
+
+
+# показатель степени зависимости времени от размера по крайним точкам кривой:
+# около 1 для линейного роста, около 2 для квадратичного
+def scaling(results):
+    curves = {}
+    for result in results:
+        curves.setdefault(result['name'], []).append(result)
+    summary = {}
+    for name, curve in curves.items():
+        curve.sort(key=lambda result: result['size'])
+        first, last = curve[0], curve[-1]
+        exponent = None
+        if last['size'] > first['size'] and first['seconds'] > 0 and last['seconds'] > 0:
+            exponent = log(last['seconds'] / first['seconds']) / log(last['size'] / first['size'])
+        summary[name] = {
+            'sizes': [result['size'] for result in curve],
+            'seconds': [result['seconds'] for result in curve],
+            'exponent': exponent,
+        }
+    return summary
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks for the animation builders and director')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='file to write JSON report to instead of stdout')
+    args = parser.parse_args()
+
+    results = []
+    for bench in (bench_build_periodic, bench_build_cycle, bench_get_location, bench_log):
+        results.extend(bench(args.sizes, args.repeat))
+    report = dumps({'results': results, 'scaling': scaling(results)}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
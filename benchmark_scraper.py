@@ -0,0 +1,268 @@
+# offline end-to-end benchmarks of parser.py and search.py against a local stand-in of the admission lists site.
+# Run: python benchmark_scraper.py [--rows 1000 10000 100000] [--students 100 1000] [--repeat 3]
+#                                  [--format xlsx] [--stages] [--output result.json]
+# Synthetic data (the admission list page, fio/XX.json shards and contest pages) is generated with a fixed seed
+# and served by a server running in a separate process, so that its allocations do not count towards peak memory.
+# Results (throughput in rows or students per second and peak memory by tracemalloc) are printed as JSON
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from hashlib import md5, sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from json import dumps
+from multiprocessing import Process, Queue
+from os import devnull, path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import parser
+import search
+from http_client import HttpClient
+from metrics import metrics
+
+SURNAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев', 'Козлов']
+FIRST_NAMES = ['Алексей', 'Дмитрий', 'Иван', 'Сергей', 'Андрей', 'Михаил', 'Никита', 'Павел']
+PATRONYMICS = ['Алексеевич', 'Дмитриевич', 'Иванович', 'Сергеевич', 'Андреевич', 'Михайлович']
+
+SITE_LEGEND = ['№', 'ФИО', 'Согл', 'Тип', '∑', 'Другие ОП']
+CONTEST_LEGEND = SITE_LEGEND + search.get_subjects()
+PARSER_LEGEND = ['number', 'name', 'type', 'sum', 'accept_here', 'accept_else']
+
+
+# synthetic data
+
+# unique full names; the index keeps them unique however many are needed
+def generate_names(count: int, rng: Random) -> List[str]:
+    return [f'{rng.choice(SURNAMES)}-{index} {rng.choice(FIRST_NAMES)} {rng.choice(PATRONYMICS)}'
+            for index in range(count)]
+
+
+# html table in the layout of admlist.ru; cells of marked_column are wrapped in <b> for marked rows
+def render_table(legend: List[str], rows: List[Tuple[List, bool]], marked_column: str = 'Другие ОП') -> str:
+    marked_index = legend.index(marked_column)
+    parts = ['<table><thead><tr>', ''.join(f'<th>{key}</th>' for key in legend), '</tr></thead><tbody>']
+    for values, marked in rows:
+        cells = [f'<b>{value}</b>' if marked and index == marked_index else str(value)
+                 for index, value in enumerate(values)]
+        parts.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>')
+    parts.append('</tbody></table>')
+    return ''.join(parts)
+
+
+def random_site_row(number: int, name: str, rng: Random) -> Tuple[List, bool]:
+    marked = rng.random() < 0.3
+    values = [number, name, rng.choice(['Да', 'Нет']), rng.choice(['ОК', 'БВИ', 'ЦП']), rng.randint(150, 310),
+              'Да' if marked else 'Нет']
+    return values, marked
+
+
+# admission list page with `rows` applicants; as on the real page, the list is the last table of the document
+def generate_site(rows: int, seed: int = 0) -> Dict[str, bytes]:
+    rng = Random(seed)
+    names = generate_names(rows, rng)
+    table = render_table(SITE_LEGEND, [random_site_row(number, name, rng) for number, name in enumerate(names, 1)])
+    page = f'<html><body><table><tr><td>menu</td></tr></table>{table}</body></html>'
+    return {parser.SITE_PATH: page.encode()}
+
+
+# fio/XX.json shards and contest pages for `students` students, each applying to 1-3 of `contests` contests.
+# Returns served files and the roster of students
+def generate_applications(students: int, contests: int = 20, seed: int = 0) -> Tuple[Dict[str, bytes], List[str]]:
+    rng = Random(seed)
+    names = generate_names(students, rng)
+    contest_names = [f'bmstu/{md5(str(index).encode()).hexdigest()}' for index in range(contests)]
+    contest_rows = {contest: [] for contest in contest_names}
+    shards: Dict[str, Dict[str, List]] = {}
+    for name in names:
+        applications = []
+        for contest in rng.sample(contest_names, rng.randint(1, min(3, contests))):
+            values, marked = random_site_row(len(contest_rows[contest]) + 1, name, rng)
+            values += [rng.randint(40, 100) for _ in search.get_subjects()]
+            contest_rows[contest].append((values, marked))
+            applications.append([contest, values[0]])
+        name_hash = search.get_hash(name)
+        shards.setdefault(name_hash[:2], {})[name_hash] = applications
+    files = {f'/fio/{prefix}.json': dumps(shard, ensure_ascii=False).encode() for prefix, shard in shards.items()}
+    for contest, rows in contest_rows.items():
+        files[f'/{contest}.html'] = f'<html><body>{render_table(CONTEST_LEGEND, rows)}</body></html>'.encode()
+    return files, names
+
+
+# local stand-in server
+
+# serves generated files with keep-alive connections and ETag validation, as a real static server would
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent in a single segment, otherwise Nagle's algorithm delays every response
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        entry = self.server.files.get(urlsplit(self.path).path)
+        if entry is None:
+            self.send_error(404)
+            return
+        body, etag = entry
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(files: Dict[str, bytes], ports: Queue):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.files = {name: (body, f'"{sha1(body).hexdigest()}"') for name, body in files.items()}
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+# server of the given files in a separate process for the duration of a with block; url is its root
+class FixtureServer:
+    def __init__(self, files: Dict[str, bytes]):
+        self._files = files
+        self._process = None
+        self.url = None
+
+    def __enter__(self):
+        ports = Queue()
+        self._process = Process(target=serve, args=(self._files, ports), daemon=True)
+        self._process.start()
+        self.url = f'http://127.0.0.1:{ports.get(timeout=30)}'
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._process.terminate()
+        self._process.join()
+        return False
+
+
+# point parser and search at the given site root
+def set_base_url(url: str):
+    parser.BASE_URL = url
+    search.BASE_URL = url
+
+
+# measurements
+
+# best time of several runs and a separate run under tracemalloc for peak memory,
+# so that tracing of allocations does not distort the time.
+# Stage metrics, if enabled, are totals of the timed runs only
+def measure(func, repeat):
+    enabled = metrics.enabled
+    metrics.reset()
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        seconds = min(seconds, perf_counter() - start)
+    stages = metrics.snapshot() if enabled else None
+    metrics.enabled = False
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        metrics.enabled = enabled
+    return seconds, peak, stages
+
+
+def record(name, size, unit, func, repeat):
+    seconds, peak, stages = measure(func, repeat)
+    result = {
+        'name': name,
+        'size': size,
+        'seconds': seconds,
+        f'{unit}_per_second': size / seconds if seconds else None,
+        'peak_bytes': peak,
+    }
+    if stages is not None:
+        result['stages'] = stages
+    return result
+
+
+# parse_site -> process_table -> save_to_excel for admission lists of each size
+def bench_parser(sizes, repeat, directory, extension):
+    results = []
+    for size in sizes:
+        file_name = path.join(directory, f'site{extension}')
+
+        def run():
+            table = parser.process_table(parser.parse_site(StringIO()))
+            parser.save_to_excel(table, PARSER_LEGEND, file_name)
+
+        with FixtureServer(generate_site(size)) as server:
+            set_base_url(server.url)
+            results.append(record('parser', size, 'rows', run, repeat))
+    return results
+
+
+# process_students and process_students_concurrently for rosters of each size; every run starts with
+# an empty HTTP cache (which also keeps parsed contest tables), so that it fetches everything as a real run does
+def bench_students(sizes, repeat, directory, extension):
+    results = []
+    for size in sizes:
+        files, names = generate_applications(size)
+        file_name = path.join(directory, f'students{extension}')
+
+        def run_sequential():
+            search.default_client = HttpClient()
+            search.process_students(iter(names), writer=search.get_streaming_writer(file_name))
+            search.default_client.close()
+
+        def run_concurrent():
+            client = HttpClient()
+            search.process_students_concurrently(iter(names), writer=search.get_streaming_writer(file_name),
+                                                 client=client)
+            client.close()
+
+        with FixtureServer(files) as server, open(devnull, 'w') as output, redirect_stdout(output):
+            set_base_url(server.url)
+            results.append(record('process_students', size, 'students', run_sequential, repeat))
+            results.append(record('process_students_concurrently', size, 'students', run_concurrent, repeat))
+    return results
+
+
+def main():
+    arguments = ArgumentParser(description='Offline end-to-end benchmarks of the scraper against a local server')
+    arguments.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                           help='sizes of the admission list for parser')
+    arguments.add_argument('--students', type=int, nargs='+', default=[100, 1000],
+                           help='sizes of the roster for process_students')
+    arguments.add_argument('--repeat', type=int, default=3)
+    arguments.add_argument('--format', default='xlsx', choices=['xlsx', 'csv', 'parquet', 'arrow'],
+                           help='format of exported files')
+    arguments.add_argument('--stages', action='store_true', help='add stage metrics of every benchmark to the report')
+    arguments.add_argument('--output', help='file to write JSON report to instead of stdout')
+    args = arguments.parse_args()
+
+    if args.stages:
+        metrics.enable()
+    results = []
+    with TemporaryDirectory() as directory:
+        results.extend(bench_parser(args.rows, args.repeat, directory, f'.{args.format}'))
+        results.extend(bench_students(args.students, args.repeat, directory, f'.{args.format}'))
+    report = dumps({'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
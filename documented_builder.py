@@ -1,43 +1,223 @@
 # импортируем все нужное для создания абстрактного класса
 from abc import ABC, abstractmethod, abstractproperty
-
-
-# простой класс "анимации": хранится массив ключевых точек с временными метками 
+from array import array
+import atexit
+from bisect import bisect_right
+from itertools import accumulate, islice
+import sys
+from weakref import WeakSet
+
+# numpy нужен только для векторизованного вычисления координат, поэтому он необязателен
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# простой класс "анимации": хранится массив ключевых точек с временными метками.
+# Ключевые точки хранятся по столбцам в компактных массивах чисел двойной точности,
+# а не списком кортежей, что заметно экономит память на длинных анимациях
 class Animation:
-    def __init__(self):
-        self._data = [(0, 0, 0)]
+    __slots__ = ('_xs', '_ys', '_times')
+
+    # по умолчанию анимация начинается в начале координат в нулевой момент времени
+    def __init__(self, x=0, y=0, t=0):
+        self._xs = array('d', (x,))
+        self._ys = array('d', (y,))
+        # отсортированный массив временных меток к тому же нужен для двоичного поиска
+        self._times = array('d', (t,))
 
     def __repr__(self):
         return f'Animation(last keyframe: ({self.x}, {self.y}) at {self.t})'
 
+    def __len__(self):
+        return len(self._times)
+
     # добавление ключевых точек осуществляется через единственный метод
     # и по абсолютным значениям, что не всегда удобно
     def add_point(self, x, y, t):
-        self._data.append((x, y, t))
+        self._xs.append(x)
+        self._ys.append(y)
+        self._times.append(t)
+
+    # пакетное добавление ключевых точек по массивам абсолютных значений
+    def add_points(self, xs, ys, ts):
+        xs, ys, ts = array('d', xs), array('d', ys), array('d', ts)
+        if not len(xs) == len(ys) == len(ts):
+            raise ValueError('coordinate and time arrays must have equal lengths')
+        self._xs.extend(xs)
+        self._ys.extend(ys)
+        self._times.extend(ts)
 
     # для примера функциональности класса есть возможность определить координаты,
-    # которые соответствуют определенному моменту времени
+    # которые соответствуют определенному моменту времени;
+    # нужный отрезок между ключевыми точками находится двоичным поиском по временным меткам
     def get_location(self, t):
-        if t >= self.t:
+        if t >= self.t or len(self._times) == 1:
             return (self.x, self.y)
-        else:
-            for left_keyframe, right_keyframe in zip(self._data[:-1], self._data[1:]):
-                if right_keyframe[2] > t:
-                    k = (t - left_keyframe[2]) / (right_keyframe[2] - left_keyframe[2])
-                    return (k * right_keyframe[0] + (1 - k) * left_keyframe[0], k * right_keyframe[1] + (1 - k) * left_keyframe[1])
+        return self._interpolate(max(bisect_right(self._times, t), 1), t)
+
+    # пакетное определение координат для отсортированной последовательности моментов времени:
+    # ключевые точки и моменты времени проходятся одновременно за один проход слиянием
+    def sample(self, times):
+        result = []
+        last_time = self.t
+        single = len(self._times) == 1
+        i = 1
+        previous = None
+        for t in times:
+            if t >= last_time or single:
+                result.append((self.x, self.y))
+                continue
+            if previous is not None and t < previous:
+                # последовательность оказалась неотсортированной - начинаем поиск заново
+                i = max(bisect_right(self._times, t), 1)
+            else:
+                while self._times[i] <= t:
+                    i += 1
+            previous = t
+            result.append(self._interpolate(i, t))
+        return result
+
+    # векторизованное определение координат для целого массива моментов времени:
+    # результатом служит массив размера (N, 2) с той же семантикой, что и у get_location
+    def sample_array(self, times):
+        if np is None:
+            raise ImportError('sample_array requires numpy')
+        times = np.asarray(times, dtype=float)
+        xs, ys, keyframe_times = np.frombuffer(self._xs), np.frombuffer(self._ys), np.frombuffer(self._times)
+        result = np.empty((len(times), 2))
+        last = len(keyframe_times) - 1
+        if last == 0:
+            result[:] = (xs[-1], ys[-1])
+            return result
+        right = np.clip(np.searchsorted(keyframe_times, times, side='right'), 1, last)
+        left = right - 1
+        # на отрезках нулевой длины получаются бесконечности и nan, но такие значения ниже перезаписываются
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = (times - keyframe_times[left]) / (keyframe_times[right] - keyframe_times[left])
+            result[:, 0] = k * xs[right] + (1 - k) * xs[left]
+            result[:, 1] = k * ys[right] + (1 - k) * ys[left]
+        # после последней ключевой точки объект остается на месте
+        result[times >= keyframe_times[-1]] = (xs[-1], ys[-1])
+        return result
+
+    # линейная интерполяция между ключевыми точками с индексами i - 1 и i
+    def _interpolate(self, i, t):
+        xs, ys, times = self._xs, self._ys, self._times
+        k = (t - times[i - 1]) / (times[i] - times[i - 1])
+        return (k * xs[i] + (1 - k) * xs[i - 1], k * ys[i] + (1 - k) * ys[i - 1])
 
     # свойства, возвращающие информацию о последней добавленной точке
     @property
     def x(self):
-        return self._data[-1][0]
+        return self._xs[-1]
+
+    @property
+    def y(self):
+        return self._ys[-1]
+
+    @property
+    def t(self):
+        return self._times[-1]
+
+
+# "ленивая" периодическая анимация: хранится лишь один период и число его повторений,
+# а координаты внутри повторений определяются по времени, взятому по модулю периода.
+# Ключевые точки, добавленные до повторений, хранятся в обычной анимации-предшественнике,
+# а добавленные после них - в обычной анимации-продолжении
+class PeriodicAnimation:
+    __slots__ = ('_prefix', '_period', '_count', '_tail')
+
+    # период должен начинаться в нулевой момент времени и заканчиваться там же, где начался;
+    # повторения начинаются в момент последней ключевой точки предшественника, которая должна
+    # совпадать с началом периода. Без предшественника повторения начинаются в нулевой момент времени
+    def __init__(self, period: Animation, count, prefix: Animation = None):
+        self._prefix = Animation(period._xs[0], period._ys[0]) if prefix is None else prefix
+        self._period = period
+        self._count = count
+        self._tail = Animation(period.x, period.y, self._prefix.t + period.t * count)
+
+    def __repr__(self):
+        return f'PeriodicAnimation({self._period} x {self._count}, last keyframe: ({self.x}, {self.y}) at {self.t})'
+
+    def __len__(self):
+        return len(self._prefix) + (len(self._period) - 1) * self._count + len(self._tail) - 1
+
+    def add_point(self, x, y, t):
+        self._tail.add_point(x, y, t)
+
+    def add_points(self, xs, ys, ts):
+        self._tail.add_points(xs, ys, ts)
+
+    # момент начала первого повторения периода
+    @property
+    def _repeats_start(self):
+        return self._prefix.t
+
+    # момент окончания последнего повторения периода
+    @property
+    def _repeats_end(self):
+        return self._tail._times[0]
+
+    def get_location(self, t):
+        start = self._repeats_start
+        if start <= t < self._repeats_end:
+            return self._period.get_location((t - start) % self._period.t)
+        elif t < start:
+            return self._before(t)
+        return self._tail.get_location(t)
+
+    def sample(self, times):
+        return [self.get_location(t) for t in times]
+
+    def sample_array(self, times):
+        if np is None:
+            raise ImportError('sample_array requires numpy')
+        times = np.asarray(times, dtype=float)
+        start = self._repeats_start
+        result = self._tail.sample_array(times)
+        before = times < start
+        repeated = ~before & (times < self._repeats_end)
+        if len(self._prefix) > 1:
+            result[before] = self._prefix.sample_array(times[before])
+        else:
+            result[before] = self._period.sample_array(times[before] - start)
+        result[repeated] = self._period.sample_array((times[repeated] - start) % self._period.t)
+        return result
+
+    # координаты до начала повторений - те же, что дала бы раскрытая анимация:
+    # без предшественника она продолжает первый отрезок периода
+    def _before(self, t):
+        if len(self._prefix) > 1:
+            return self._prefix.get_location(t)
+        return self._period.get_location(t - self._repeats_start)
+
+    # раскрытие в обычную анимацию с явными ключевыми точками всех повторений
+    def expand(self) -> Animation:
+        prefix, period = self._prefix, self._period
+        result = Animation(prefix._xs[0], prefix._ys[0], prefix._times[0])
+        result.add_points(prefix._xs[1:], prefix._ys[1:], prefix._times[1:])
+        for repeat in range(self._count):
+            offset = prefix.t + repeat * period.t
+            for i in range(1, len(period)):
+                result.add_point(period._xs[i], period._ys[i], period._times[i] + offset)
+        tail = self._tail
+        for i in range(1, len(tail)):
+            result.add_point(tail._xs[i], tail._ys[i], tail._times[i])
+        return result
+
+    @property
+    def x(self):
+        return self._tail.x
 
     @property
     def y(self):
-        return self._data[-1][1]
+        return self._tail.y
 
     @property
     def t(self):
-        return self._data[-1][2]
+        return self._tail.t
 
 
 # абстрактный базовый класс нужного нам строителя
@@ -59,33 +239,100 @@ class AnimationBuilder(ABC):
     def move_to(self, x, y, t):
         pass
 
+    # движение до точки и обратно в начало координат c раз;
+    # по умолчанию оно раскрывается в последовательность отдельных перемещений
+    def move_periodic(self, x, y, t, c):
+        for _ in range(c):
+            self.move_to(x, y, t)
+            self.move_to(0, 0, t)
+
+    # пакетное перемещение по массивам координат и отсечек времени;
+    # по умолчанию оно раскрывается в последовательность отдельных перемещений
+    def move_many(self, xs, ys, ts):
+        for x, y, t in zip(xs, ys, ts):
+            self.move_to(x, y, t)
 
-# реализация строителя с перемещением от точки к точке по прямой линии,
-# но с заданием отсечек времени вместо временных меток при добавлении ключевой точки
-class StraightAnimationBuilder(AnimationBuilder):
+
+# пакет перемещений в виде списков; массивы координат и отсечек времени должны быть одной длины
+def _batch(xs, ys, ts):
+    xs, ys, ts = list(xs), list(ys), list(ts)
+    if not len(xs) == len(ys) == len(ts):
+        raise ValueError('coordinate and time arrays must have equal lengths')
+    return xs, ys, ts
+
+
+# накопленные суммы отсечек времени, начиная от момента start, дают абсолютные временные метки
+def _timestamps(start, ts):
+    return islice(accumulate(ts, initial=start), 1, None)
+
+
+# промежуточный базовый класс строителей объектов Animation: периодическое движение строится
+# лишь один раз, а результат становится "ленивой" периодической анимацией, для которой уже построенные
+# перемещения служат предшественником. Повторное периодическое движение раскрывается явно
+class KeyframeAnimationBuilder(AnimationBuilder):
     def reset(self):
         self._product = Animation()
 
+    def move_periodic(self, x, y, t, c):
+        prefix = self._product
+        if c <= 1 or not isinstance(prefix, Animation):
+            super().move_periodic(x, y, t, c)
+            return
+        # повторения одинаковы, только начиная с начала координат, поэтому первое из них,
+        # начинающееся в другой точке, строится явно
+        if prefix.x != 0 or prefix.y != 0:
+            super().move_periodic(x, y, t, 1)
+            c -= 1
+        self._product = Animation()
+        super().move_periodic(x, y, t, 1)
+        self._product = PeriodicAnimation(self._product, c, prefix)
+
+
+# реализация строителя с перемещением от точки к точке по прямой линии,
+# но с заданием отсечек времени вместо временных меток при добавлении ключевой точки
+class StraightAnimationBuilder(KeyframeAnimationBuilder):
     def move_to(self, x, y, t):
         self._product.add_point(x, y, self._product.t + t)
 
+    def move_many(self, xs, ys, ts):
+        self._product.add_points(xs, ys, _timestamps(self._product.t, ts))
+
 
 # реализация строителя с перемещением, характерным для ладьи:
 # сначала строго по вертикали, затем строго по горизонтали
-class RookAnimationBuilder(AnimationBuilder):
-    def reset(self):
-        self._product = Animation()
-
+class RookAnimationBuilder(KeyframeAnimationBuilder):
     def move_to(self, x, y, t):
         dx, dy = x - self._product.x, y - self._product.y
         s = abs(dx) + abs(dy)
         if s == 0:
-            self._product.add_point(x, y, self._product.t + ty)
+            self._product.add_point(x, y, self._product.t + t)
         else:
             tx, ty = abs(dx) / s * t, abs(dy) / s * t
             self._product.add_point(self._product.x, y, self._product.t + ty)
             self._product.add_point(x, y, self._product.t + tx)
 
+    # положение после каждого перемещения хранится в локальных переменных,
+    # а ключевые точки добавляются в анимацию одним пакетом
+    def move_many(self, xs, ys, ts):
+        xs, ys, ts = _batch(xs, ys, ts)
+        px, py, pt = self._product.x, self._product.y, self._product.t
+        new_xs, new_ys, new_ts = array('d'), array('d'), array('d')
+        for x, y, t in zip(xs, ys, ts):
+            dx, dy = x - px, y - py
+            s = abs(dx) + abs(dy)
+            if s == 0:
+                pt += t
+            else:
+                pt += abs(dy) / s * t
+                new_xs.append(px)
+                new_ys.append(y)
+                new_ts.append(pt)
+                pt += abs(dx) / s * t
+            new_xs.append(x)
+            new_ys.append(y)
+            new_ts.append(pt)
+            px, py = x, y
+        self._product.add_points(new_xs, new_ys, new_ts)
 
 
 # реализация строителя, собирающего информацию о перемещениях в список ключевых точек,
@@ -99,22 +346,135 @@ class ListAnimationBuilder(AnimationBuilder):
     def move_to(self, x, y, t):
         self._product.append((x, y, t + self._product[-1][2]))
 
+    def move_many(self, xs, ys, ts):
+        xs, ys, ts = _batch(xs, ys, ts)
+        self._product.extend(zip(xs, ys, _timestamps(self._product[-1][2], ts)))
+
+
+# приемники текстового журнала перемещений: строитель журнала пишет в них строку за строкой,
+# а итоговый результат забирает из свойства value
+
+# приемник, накапливающий строки в списке и склеивающий их один раз по требованию
+class ListLogSink:
+    def __init__(self):
+        self._lines = []
+
+    def write(self, line):
+        self._lines.append(line)
+
+    def flush(self):
+        pass
+
+    @property
+    def value(self):
+        return ''.join(self._lines)
+
+
+# приемник, сразу передающий строки в файл или любой другой текстовый поток
+class StreamLogSink:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, line):
+        self._stream.write(line)
+
+    def flush(self):
+        self._stream.flush()
+
+    @property
+    def value(self):
+        return self._stream
+
 
-# реализация строителя, ведущего запись информации о перемещениях в текстовом виде
+# существующие буферизованные приемники; слабые ссылки не продлевают им жизнь до завершения программы
+_live_sinks = WeakSet()
+
+
+# передача в потоки остатков порций всех еще существующих приемников при завершении программы
+@atexit.register
+def _flush_live_sinks():
+    for sink in list(_live_sinks):
+        sink.flush()
+
+
+# приемник, передающий строки в поток (по умолчанию - стандартный поток вывода) порциями
+# по chunk_size строк, чтобы не обращаться к потоку на каждое перемещение.
+# Остаток порции передается в поток и при удалении приемника, и при завершении программы,
+# так что строки не теряются, даже если результат так и не был запрошен
+class BufferedLogSink(StreamLogSink):
+    def __init__(self, stream=None, chunk_size=1024):
+        super().__init__(sys.stdout if stream is None else stream)
+        self._buffer = []
+        self._chunk_size = chunk_size
+        _live_sinks.add(self)
+
+    def __del__(self):
+        self.flush()
+
+    def write(self, line):
+        self._buffer.append(line)
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._stream.write(''.join(self._buffer))
+            self._buffer.clear()
+        self._stream.flush()
+
+
+# реализация строителя, ведущего запись информации о перемещениях в текстовом виде.
+# Записи передаются в приемник, который создается фабрикой sink_factory при каждом сбросе строителя
 class AnimationLogBuilder(AnimationBuilder):
+    def __init__(self, sink_factory=ListLogSink):
+        self._sink_factory = sink_factory
+        super().__init__()
+
+    @property
+    def product(self):
+        self._product.flush()
+        result = self._product.value
+        self.reset()
+        return result
+
     def reset(self):
-        self._product = ''
+        self._product = self._sink_factory()
 
     def move_to(self, x, y, t):
-        self._product += f'moving to ({x}, {y}) in {t} seconds\n'
+        self._product.write(self._format_move(x, y, t))
+
+    # весь пакет перемещений передается в приемник одной записью
+    def move_many(self, xs, ys, ts):
+        xs, ys, ts = _batch(xs, ys, ts)
+        self._product.write(''.join(map(self._format_move, xs, ys, ts)))
+
+    @staticmethod
+    def _format_move(x, y, t):
+        return f'moving to ({x}, {y}) in {t} seconds\n'
 
 
 # реализация строителя, ведущего запись информации о перемещениях в текстовом виде,
-# с печатью в стандартный поток вывода
+# с печатью в стандартный поток вывода (или в другой приемник echo).
+# По умолчанию каждая запись сразу передается в поток; печать порциями включается
+# передачей echo=BufferedLogSink()
 class AnimationVerboseLogBuilder(AnimationLogBuilder):
+    def __init__(self, sink_factory=ListLogSink, echo=None):
+        self._echo = StreamLogSink(sys.stdout) if echo is None else echo
+        super().__init__(sink_factory)
+
+    @property
+    def product(self):
+        self._echo.flush()
+        return super().product
+
     def move_to(self, x, y, t):
         super().move_to(x, y, t)
-        print(f'moving to ({x}, {y}) in {t} seconds')
+        self._echo.write(self._format_move(x, y, t))
+
+    def move_many(self, xs, ys, ts):
+        xs, ys, ts = _batch(xs, ys, ts)
+        super().move_many(xs, ys, ts)
+        self._echo.write(''.join(map(self._format_move, xs, ys, ts)))
 
 
 # класс директора, позволяющий создавать сложные последовательности движений
@@ -133,15 +493,13 @@ class AnimationDirector:
 
     # пример работы директора: движение до точки и обратно несколько раз
     def build_periodic(self, t, x, y, c):
-        for _ in range(c):
-            self._builder.move_to(x, y, t)
-            self._builder.move_to(0, 0, t)
+        self._builder.move_periodic(x, y, t, c)
 
     # пример работы директора: движение от точки к точке и возвращение в обратно
     def build_cycle(self, t, *points):
-        for point in points:
-            self._builder.move_to(point[0], point[1], t)
-        self._builder.move_to(0, 0, t)
+        xs = [point[0] for point in points] + [0]
+        ys = [point[1] for point in points] + [0]
+        self._builder.move_many(xs, ys, [t] * len(xs))
 
 
 # небольшая демонстрация работы
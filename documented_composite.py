@@ -1,118 +1,472 @@
 from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from os import cpu_count
+import sys
+from threading import Lock
 
 
 # базовый астрактный класс, представляющий некое выражение
+# Узлы выражений объявляют __slots__ и не хранят словарь атрибутов, что экономит память на больших выражениях
 class Expression(ABC):
-    # в каждом выражении нас интересует возможность вычислить его значение
+    __slots__ = ()
+
+    # в каждом выражении нас интересует возможность вычислить его значение;
+    # значения переменных берутся из словаря env и могут быть как числами, так и массивами numpy -
+    # тогда выражение вычисляется поэлементно над всем массивом за один проход.
+    # Обход выполняется с явным стеком, поэтому глубина выражения не ограничена глубиной рекурсии;
+    # константы и переменные переопределяют этот метод, просто возвращая свое значение.
+    # Значения общих операций (см. optimize и _shared) запоминаются на время вычисления, так что такой
+    # узел вычисляется один раз, сколько бы ссылок на него ни было; промежуточные значения остальных
+    # операций не удерживаются, что важно при вычислении над большими массивами
+    def evaluate(self, env: dict = None) -> float:
+        values = []
+        shared = set(self._shared())
+        computed = {}
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            children = node._children()
+            if not children:
+                values.append(node.evaluate(env))
+            elif ready:
+                arguments = values[-len(children):]
+                del values[-len(children):]
+                value = node._operate(*arguments)
+                if id(node) in shared:
+                    computed[id(node)] = value
+                values.append(value)
+            elif id(node) in computed:
+                values.append(computed[id(node)])
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+        return values[0]
+
+    # выражение, которое предстоит вычислять много раз, можно скомпилировать заранее:
+    # в режиме 'stack' получается плоская постфиксная программа для стековой машины,
+    # в режиме 'python' - функция Python, сгенерированная из исходного текста выражения.
+    # Операции, на которые в выражении ссылаются несколько раз (см. optimize), вычисляются лишь однажды:
+    # их значения запоминаются в пронумерованных ячейках или локальных переменных
+    def compile(self, mode: str = 'stack'):
+        if mode == 'stack':
+            slots = {key: slot for slot, key in enumerate(self._shared())}
+            return StackProgram(self._emit(slots), len(slots))
+        elif mode == 'python':
+            return PythonProgram(self._emit_source())
+        raise ValueError(f'unknown compilation mode: {mode}')
+
+    # оптимизация выражения: константные подвыражения сворачиваются в одну константу, унарные плюсы
+    # отбрасываются, а структурно равные подвыражения заменяются одним общим узлом.
+    # Результатом служит новое выражение (в общем случае - направленный ациклический граф),
+    # исходное выражение не изменяется
+    def optimize(self) -> 'Expression':
+        table = {}
+        optimized = {}
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in optimized:
+                continue
+            if ready:
+                optimized[id(node)] = node._optimized([optimized[id(child)] for child in node._children()], table)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node._children())
+        return optimized[id(self)]
+
+    # запись операции вида Addition(Constant(1.0), Variable(x)) строится обходом с явным стеком,
+    # чтобы печать глубоких выражений не упиралась в глубину рекурсии; константы и переменные
+    # переопределяют этот метод
+    def __repr__(self):
+        parts = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+            elif not item._children():
+                parts.append(repr(item))
+            else:
+                parts.append(f'{item.__class__.__name__}(')
+                stack.append(')')
+                for index, child in enumerate(reversed(item._children())):
+                    if index:
+                        stack.append(', ')
+                    stack.append(child)
+        return ''.join(parts)
+
+    # непосредственные операнды выражения
+    @abstractmethod
+    def _children(self) -> tuple:
+        pass
+
+    # оптимизированная копия узла с уже оптимизированными операндами; равные узлы берутся из таблицы table
+    @abstractmethod
+    def _optimized(self, children: list, table: dict) -> 'Expression':
+        pass
+
+    # идентификаторы операций, на которые в выражении есть более одной ссылки
+    def _shared(self) -> list:
+        seen, shared = set(), {}
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            children = node._children()
+            if not children:
+                continue
+            if id(node) in seen:
+                shared[id(node)] = None
+                continue
+            seen.add(id(node))
+            stack.extend(children)
+        return list(shared)
+
+    # постфиксная программа, вычисляющая выражение; обход выполняется с явным стеком.
+    # Значение общего подвыражения сохраняется в ячейку при первом вычислении и берется из нее впоследствии
+    def _emit(self, slots: dict) -> list:
+        instructions = []
+        computed = set()
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            slot = slots.get(id(node))
+            if ready:
+                instructions.append(node._instruction())
+                if slot is not None:
+                    instructions.append((STORE, slot))
+                    computed.add(slot)
+            elif slot is not None and slot in computed:
+                instructions.append((FETCH, slot))
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node._children()))
+        return instructions
+
+    # то же в виде исходного текста функции на Python: значение каждой операции присваивается
+    # отдельной локальной переменной, поэтому вложенность текста не растет с глубиной выражения,
+    # а общие подвыражения вычисляются один раз сами собой. Обход выполняется с явным стеком
+    def _emit_source(self) -> str:
+        lines = ['def _program(env):']
+        names = {}
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in names:
+                continue
+            children = node._children()
+            if not children:
+                names[id(node)] = node._source([])
+            elif ready:
+                name = names[id(node)] = f'_t{len(lines) - 1}'
+                lines.append(f'    {name} = {node._source([names[id(child)] for child in children])}')
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+        lines.append(f'    return {names[id(self)]}')
+        return '\n'.join(lines) + '\n'
+
+    # инструкция постфиксной программы, выполняющая действие узла над уже вычисленными операндами
+    @abstractmethod
+    def _instruction(self) -> tuple:
+        pass
+
+    # исходный текст действия узла на Python над операндами - числами, обращениями к переменным
+    # или именами локальных переменных со значениями операций
     @abstractmethod
-    def evaluate(self) -> float:
+    def _source(self, operands: list) -> str:
         pass
 
 
 # класс, представляющий константу
 class Constant(Expression):
+    __slots__ = ('_value',)
+
     # конструктор константы извлекает ее значение из строки и хранит его в виде числа с плавающей точкой
     def __init__(self, s):
         self._value = float(s)
 
     # вычисление значения выражения из одной константы заключается в простом извлечении такового из памяти
-    def evaluate(self) -> float:
+    def evaluate(self, env: dict = None) -> float:
         return self._value
 
+    def _children(self) -> tuple:
+        return ()
+
+    # float.hex различает 0.0 и -0.0, которые равны как числа
+    def _optimized(self, children: list, table: dict) -> Expression:
+        return table.setdefault((Constant, self._value.hex()), self)
+
+    def _instruction(self) -> tuple:
+        return (PUSH, self._value)
+
+    # отрицательная константа (например, полученная сверткой) берется в скобки, чтобы знак не связался
+    # с последующим возведением в степень
+    def _source(self, operands: list) -> str:
+        source = repr(self._value)
+        return f'({source})' if source.startswith('-') else source
+
     def __repr__(self):
         return f'Constant({self._value})'
 
 
+# класс, представляющий именованную переменную, значение которой передается при вычислении
+class Variable(Expression):
+    __slots__ = ('_name',)
+
+    def __init__(self, name: str):
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def evaluate(self, env: dict = None) -> float:
+        try:
+            return (env or {})[self.name]
+        except KeyError:
+            raise EvaluationError(f'variable {self.name} is not defined')
+
+    def _children(self) -> tuple:
+        return ()
+
+    def _optimized(self, children: list, table: dict) -> Expression:
+        return table.setdefault((Variable, self.name), self)
+
+    def _instruction(self) -> tuple:
+        return (LOAD, self.name)
+
+    def _source(self, operands: list) -> str:
+        return f'env[{self.name!r}]'
+
+    def __repr__(self):
+        return f'Variable({self.name})'
+
+
 # класс, представляющий унарную операцию
 class UnaryOperation(Expression):
-    # конструктор унарной операции может принять её операнд, а может позволить пользователю дописать их позже
-    # самостоятельно
-    def __init__(self, right: Expression = None):
-        self.right = right
+    __slots__ = ('_right',)
 
-    # вычисление значения унарной операции заключается в применении операции над предварительно высчитанными
-    # значениями операндов
-    def evaluate(self) -> float:
-        return self._operate(self.right.evaluate())
+    # конструктор унарной операции принимает её операнд; после создания операция не изменяется,
+    # поэтому одно и то же выражение можно безопасно разделять между потоками и хранить в кэше
+    def __init__(self, right: Expression):
+        self._right = right
+
+    @property
+    def right(self) -> Expression:
+        return self._right
 
-    # унарную операцию характеризует функция от одного аргумента, представляющая ее действие
+    # вычисление значения унарной операции заключается в применении операции над предварительно высчитанными
+    # значениями операндов (см. Expression.evaluate); унарную операцию характеризует функция от одного аргумента,
+    # представляющая ее действие
     @abstractmethod
     def _operate(self, y: float) -> float:
         pass
 
-    def __repr__(self):
-        return f'{self.__class__.__name__}({self.right})'
+    def _children(self) -> tuple:
+        return (self._right,)
+
+    def _optimized(self, children: list, table: dict) -> Expression:
+        right, = children
+        if isinstance(right, Constant):
+            folded = _fold(table, self._operate, right._value)
+            if folded is not None:
+                return folded
+        return table.setdefault((self.__class__, id(right)), self.__class__(right))
+
+    def _instruction(self) -> tuple:
+        return (UNARY, self._operate)
+
+    def _source(self, operands: list) -> str:
+        right, = operands
+        return f'{self._symbol}{right}'
 
 
 # класс, представляющий унырный плюс
 class UnaryPlus(UnaryOperation):
+    __slots__ = ()
+    _symbol = '+'
+
     def _operate(self, y: float) -> float:
         return y
 
+    # унарный плюс ничего не делает, поэтому при оптимизации от него остается лишь операнд
+    def _optimized(self, children: list, table: dict) -> Expression:
+        return children[0]
+
 
 # класс, представляющий унарный минус
 class UnaryMinus(UnaryOperation):
+    __slots__ = ()
+    _symbol = '-'
+
     def _operate(self, y: float) -> float:
         return -y
 
 
 # класс, представляющий бинарную операцию
 class BinaryOperation(Expression):
-    # конструктор бинарной операции может принять её операнды, а может позволить пользователю дописать их позже
-    # самостоятельно
-    def __init__(self, left: Expression = None, right: Expression = None):
-        self.left = left
-        self.right = right
+    __slots__ = ('_left', '_right')
 
-    # вычисление значения бинарной операции заключается в применении операции над предварительно высчитанными
-    # значениями операндов
-    def evaluate(self) -> float:
-        return self._operate(self.left.evaluate(), self.right.evaluate())
+    # конструктор бинарной операции принимает её операнды; после создания операция не изменяется,
+    # поэтому одно и то же выражение можно безопасно разделять между потоками и хранить в кэше
+    def __init__(self, left: Expression, right: Expression):
+        self._left = left
+        self._right = right
+
+    @property
+    def left(self) -> Expression:
+        return self._left
+
+    @property
+    def right(self) -> Expression:
+        return self._right
 
-    # бинарную операцию характеризует функция от двух аргументов, представляющая ее действие
+    # вычисление значения бинарной операции заключается в применении операции над предварительно высчитанными
+    # значениями операндов (см. Expression.evaluate); бинарную операцию характеризует функция от двух аргументов,
+    # представляющая ее действие
     @abstractmethod
     def _operate(self, x: float, y: float) -> float:
         pass
 
-    def __repr__(self):
-        return f'{self.__class__.__name__}({self.left}, {self.right})'
+    def _children(self) -> tuple:
+        return (self._left, self._right)
+
+    def _optimized(self, children: list, table: dict) -> Expression:
+        left, right = children
+        if isinstance(left, Constant) and isinstance(right, Constant):
+            folded = _fold(table, self._operate, left._value, right._value)
+            if folded is not None:
+                return folded
+        return table.setdefault((self.__class__, id(left), id(right)), self.__class__(left, right))
+
+    def _instruction(self) -> tuple:
+        return (BINARY, self._operate)
+
+    def _source(self, operands: list) -> str:
+        left, right = operands
+        return f'{left} {self._symbol} {right}'
 
 
 # класс, представляющий сложение
 class Addition(BinaryOperation):
+    __slots__ = ()
+    _symbol = '+'
+
     def _operate(self, x: float, y: float) -> float:
         return x + y
 
 
 # класс, представляющий вычитание
 class Subtraction(BinaryOperation):
+    __slots__ = ()
+    _symbol = '-'
+
     def _operate(self, x: float, y: float) -> float:
         return x - y
 
 
 # класс, представляющий произведение
 class Multiplication(BinaryOperation):
+    __slots__ = ()
+    _symbol = '*'
+
     def _operate(self, x: float, y: float) -> float:
         return x * y
 
 
 # класс, представляющий деление
 class Division(BinaryOperation):
+    __slots__ = ()
+    _symbol = '/'
+
     def _operate(self, x: float, y: float) -> float:
         return x / y
 
 
 # класс, представляющий возведение в степень
 class Exponentiation(BinaryOperation):
+    __slots__ = ()
+    _symbol = '**'
+
     def _operate(self, x: float, y: float) -> float:
         return x ** y
 
 
-# класс, представляющий часть записи математического выражения, несущей в себе информацию о приоритете вычисления
-class ExpressionPart:
-    def __init__(self, priority: int, expression: Expression):
-        self.priority = priority
-        self.expression = expression
+# свертка операции над константами при оптимизации. Если операция над константами завершается ошибкой
+# или дает не вещественное число (например, дробная степень отрицательного числа),
+# то свертка не выполняется, чтобы ошибка возникла, как и прежде, при вычислении
+def _fold(table: dict, operate, *values):
+    try:
+        value = operate(*values)
+    except ArithmeticError:
+        return None
+    if not isinstance(value, float):
+        return None
+    return Constant(value)._optimized([], table)
+
+
+# коды инструкций постфиксной программы: положить число на стек, положить на стек значение переменной,
+# применить унарную операцию к вершине стека, применить бинарную операцию к двум верхним значениям,
+# сохранить вершину стека в ячейку, положить на стек значение из ячейки
+PUSH, LOAD, UNARY, BINARY, STORE, FETCH = range(6)
+
+
+# скомпилированное выражение в виде плоской постфиксной программы, исполняемой простым циклом со стеком
+class StackProgram:
+    def __init__(self, instructions: list, slots: int = 0):
+        self._instructions = instructions
+        self._slots = slots
+
+    def evaluate(self, env: dict = None) -> float:
+        if env is None:
+            env = {}
+        stack = []
+        slots = [None] * self._slots
+        push, pop = stack.append, stack.pop
+        for code, argument in self._instructions:
+            if code == PUSH:
+                push(argument)
+            elif code == LOAD:
+                try:
+                    push(env[argument])
+                except KeyError:
+                    raise EvaluationError(f'variable {argument} is not defined')
+            elif code == UNARY:
+                stack[-1] = argument(stack[-1])
+            elif code == STORE:
+                slots[argument] = stack[-1]
+            elif code == FETCH:
+                push(slots[argument])
+            else:
+                y = pop()
+                stack[-1] = argument(stack[-1], y)
+        return stack[0]
+
+    def __repr__(self):
+        return f'StackProgram({len(self._instructions)} instructions)'
+
+
+# скомпилированное выражение в виде функции Python от словаря переменных, сгенерированной из исходного текста;
+# текст строится только из чисел, обращений к словарю по именам-идентификаторам, локальных переменных,
+# скобок и знаков операций, поэтому его исполнение безопасно
+class PythonProgram:
+    def __init__(self, source: str):
+        self.source = source
+        namespace = {'__builtins__': {}, 'inf': float('inf'), 'nan': float('nan')}
+        exec(source, namespace)
+        self._function = namespace['_program']
+
+    def evaluate(self, env: dict = None) -> float:
+        try:
+            return self._function({} if env is None else env)
+        except KeyError as e:
+            raise EvaluationError(f'variable {e.args[0]} is not defined')
+
+    def __repr__(self):
+        return f'PythonProgram({len(self.source.splitlines()) - 2} operations)'
 
 
 # класс исключения, возникающего при обработке некорректной строки записи
@@ -120,89 +474,226 @@ class ParseError(Exception):
     pass
 
 
-# функция, извлекающая выражение из строки записи
+# класс исключения, возникающего при вычислении выражения с неопределенной переменной
+class EvaluationError(Exception):
+    pass
+
+
+# бинарные операции и их приоритеты: чем меньше число, тем раньше вычисляется операция;
+# операции с равным приоритетом вычисляются слева направо
+BINARY_OPERATIONS = {
+    '^': (0, Exponentiation),
+    '*': (1, Multiplication),
+    '/': (1, Division),
+    '+': (2, Addition),
+    '-': (2, Subtraction),
+}
+
+UNARY_OPERATIONS = {
+    '+': UnaryPlus,
+    '-': UnaryMinus,
+}
+
+
+# разбиение строки записи на лексемы за один проход: числа, имена переменных, знаки операций и скобки
+def _tokenize(s: str):
+    i, n = 0, len(s)
+    while i < n:
+        c = s[i]
+        if c.isdigit() or c == '.':
+            start = i
+            while i < n and (s[i].isdigit() or s[i] == '.'):
+                i += 1
+            try:
+                constant = Constant(s[start:i])
+            except ValueError:
+                raise ParseError(f'incorrect number {s[start:i]!r} at position {start}')
+            yield constant
+            continue
+        elif c.isalpha() or c == '_':
+            start = i
+            while i < n and (s[i].isalnum() or s[i] == '_'):
+                i += 1
+            yield Variable(s[start:i])
+            continue
+        elif c in BINARY_OPERATIONS or c in '()':
+            yield c
+        elif not c.isspace():
+            raise ParseError(f'unexpected character {c!r} at position {i}')
+        i += 1
+
+
+# функция, извлекающая выражение из строки записи.
+# Разбор выполняется за один проход алгоритмом сортировочной станции с явными стеками операндов и операций,
+# поэтому время разбора линейно, а глубина вложенности скобок не ограничена глубиной рекурсии.
+# Унарный плюс или минус допустим лишь в начале выражения или сразу после открывающей скобки
+# и относится к ближайшему операнду
 def parse_expression(s: str) -> Expression:
-    balance = 0
-    digit_start = 0
-    parenthesis_start = 0
-    digit = False
-    unary = False
-    components = []
-    for i, c in enumerate(s + ' '):
-        if balance > 0:
-            if c == '(':
-                balance += 1
-            elif c == ')':
-                balance -= 1
-                if balance == 0:
-                    expression = parse_expression(s[parenthesis_start:i])
-                    if unary:
-                        unary = False
-                        part = components[-1]
-                        assert isinstance(part.expression, UnaryOperation)
-                        part.expression.right = expression
-                    else:
-                        components.append(ExpressionPart(-1, expression))
-        elif c.isdigit() or c == '.':
-            if not digit:
-                digit = True
-                digit_start = i
+    return _parse_tokens(_tokenize(s))
+
+
+# разбор последовательности лексем, полученной от _tokenize
+def _parse_tokens(tokens) -> Expression:
+    operands = []
+    # на стеке операций лежат пары (приоритет, класс) для бинарных операций,
+    # классы унарных операций и None на месте открывающих скобок
+    operations = []
+    expect_operand = True
+    group_start = True
+
+    def reduce():
+        _, operation = operations.pop()
+        right = operands.pop()
+        operands.append(operation(operands.pop(), right))
+
+    def push_operand(expression):
+        while operations and isinstance(operations[-1], type):
+            expression = operations.pop()(expression)
+        operands.append(expression)
+
+    for token in tokens:
+        if isinstance(token, Expression):
+            if not expect_operand:
+                raise ParseError('expression is incorrect')
+            push_operand(token)
+            expect_operand = group_start = False
+        elif token == '(':
+            if not expect_operand:
+                raise ParseError('expression is incorrect')
+            operations.append(None)
+            group_start = True
+        elif token == ')':
+            if expect_operand:
+                raise ParseError('expression is incorrect')
+            while operations and operations[-1] is not None:
+                reduce()
+            if not operations:
+                raise ParseError('unbalanced parentheses')
+            operations.pop()
+            push_operand(operands.pop())
+        elif expect_operand:
+            if not group_start or token not in UNARY_OPERATIONS:
+                raise ParseError('expression is incorrect')
+            operations.append(UNARY_OPERATIONS[token])
+            group_start = False
         else:
-            if digit:
-                digit = False
-                constant = Constant(s[digit_start:i])
-                if unary:
-                    unary = False
-                    part = components[-1]
-                    assert isinstance(part.expression, UnaryOperation)
-                    part.expression.right = constant
-                else:
-                    components.append(ExpressionPart(-1, constant))
-            if c == '(':
-                parenthesis_start = i + 1
-                balance += 1
-            elif c == '+':
-                if len(components) == 0:
-                    unary = True
-                    components.append(ExpressionPart(-1, UnaryPlus()))
-                else:
-                    components.append(ExpressionPart(2, Addition()))
-            elif c == '-':
-                if len(components) == 0:
-                    unary = True
-                    components.append(ExpressionPart(-1, UnaryMinus()))
-                else:
-                    components.append(ExpressionPart(2, Subtraction()))
-            elif c == '*':
-                components.append(ExpressionPart(1, Multiplication()))
-            elif c == '/':
-                components.append(ExpressionPart(1, Division()))
-            elif c == '^':
-                components.append(ExpressionPart(0, Exponentiation()))
-    for priority in range(3):
-        skip = False
-        for i, part in enumerate(components):
-            if skip:
-                skip = False
-            elif part.priority == priority:
-                assert isinstance(part.expression, BinaryOperation)
-                if i == 0 or i + 1 == len(components):
-                    raise ParseError('expression is incorrect')
-                elif components[i - 1].priority >= priority or components[i + 1].priority >= priority:
-                    raise ParseError('expression is incorrect')
-                part.expression.left = components[i - 1].expression
-                part.expression.right = components[i + 1].expression
-                components[i - 1] = None
-                components[i + 1] = ExpressionPart(-1, part.expression)
-                components[i] = None
-                skip = True
-        j = 0
-        for part in components:
-            if part is not None:
-                components[j] = part
-                j += 1
-        del components[j:]
-    return components[0].expression
+            priority, operation = BINARY_OPERATIONS[token]
+            while operations and isinstance(operations[-1], tuple) and operations[-1][0] <= priority:
+                reduce()
+            operations.append((priority, operation))
+            expect_operand = True
+    if expect_operand:
+        raise ParseError('expression is incorrect')
+    while operations:
+        if operations[-1] is None:
+            raise ParseError('unbalanced parentheses')
+        reduce()
+    return operands[0]
+
+
+# сведения о работе кэша разбора: число попаданий и промахов, наибольший и текущий размер
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+# потокобезопасный кэш разобранных выражений с вытеснением давно не использованных записей.
+# Ключом служит последовательность лексем записи, так что строки, отличающиеся лишь пробелами
+# (например, '1+2' и '1 + 2'), делят одну запись; числа в ключе сравниваются по значению.
+# Выражения неизменяемы, поэтому одно и то же выражение из кэша можно отдавать разным потребителям.
+# Строки с ошибками в кэш не попадают
+class ParseCache:
+    def __init__(self, maxsize: int = 1024):
+        if maxsize <= 0:
+            raise ValueError('cache size must be positive')
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, s: str) -> Expression:
+        tokens = list(_tokenize(s))
+        key = tuple(_token_key(token) for token in tokens)
+        with self._lock:
+            expression = self._entries.get(key)
+            if expression is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return expression
+            self.misses += 1
+        # разбор выполняется вне блокировки, чтобы не задерживать другие потоки;
+        # если одну и ту же строку одновременно разберут два потока, в кэше останется один из результатов
+        expression = _parse_tokens(tokens)
+        with self._lock:
+            self._entries[key] = expression
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        return expression
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self._maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+# ключ лексемы в кэше разбора: значение числа, имя переменной или символ операции
+def _token_key(token):
+    if isinstance(token, Constant):
+        return token.evaluate()
+    if isinstance(token, Variable):
+        return token.name
+    return token
+
+
+# общий кэш разбора для модуля
+parse_cache = ParseCache()
+
+
+# функция, извлекающая выражение из строки записи с использованием общего кэша разбора
+def parse_expression_cached(s: str) -> Expression:
+    return parse_cache.parse(s)
+
+
+# вычисление пакета строк записи в процессе-исполнителе: для каждой строки возвращается ее значение
+# либо описание ошибки, так что одна некорректная строка не прерывает обработку остальных
+def _evaluate_chunk(lines: list) -> list:
+    results = []
+    for line in lines:
+        try:
+            results.append(repr(parse_expression_cached(line).evaluate()))
+        except (ParseError, EvaluationError, ArithmeticError) as e:
+            results.append(f'error: {e.__class__.__name__}: {e}')
+    return results
+
+
+# пакетное вычисление выражений, записанных по одному в строке: строки читаются потоком, порциями по chunk_size
+# раздаются процессам-исполнителям, а результаты записываются в output в порядке входных строк.
+# Одновременно в работе находится не более двух порций на исполнителя, так что входные данные
+# не загружаются в память целиком. Возвращается число строк, вычислить которые не удалось
+def evaluate_batch(lines, output, workers: int = None, chunk_size: int = 1000) -> int:
+    workers = workers or cpu_count() or 1
+    lines = (line.rstrip('\r\n') for line in lines)
+    errors = 0
+    pending = deque()
+
+    def write_oldest():
+        nonlocal errors
+        for result in pending.popleft().result():
+            errors += result.startswith('error: ')
+            output.write(result + '\n')
+
+    with ProcessPoolExecutor(workers) as executor:
+        while chunk := list(islice(lines, chunk_size)):
+            pending.append(executor.submit(_evaluate_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                write_oldest()
+        while pending:
+            write_oldest()
+    return errors
 
 
 def demo(example: str):
@@ -215,6 +706,30 @@ def demo(example: str):
     print(expression.evaluate())
 
 
-# демонстрация работы системы
+def main():
+    parser = ArgumentParser(description='Arithmetic expression evaluator')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="evaluate newline-delimited expressions from FILE ('-' for stdin)")
+    parser.add_argument('--output', metavar='FILE', help='write batch results to FILE instead of stdout')
+    parser.add_argument('--workers', type=int, help='number of worker processes (defaults to the CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='number of lines sent to a worker at once')
+    args = parser.parse_args()
+    if args.batch is None:
+        # демонстрация работы системы
+        demo('((6.63 + (56.62 + 16.8)) + (-((60.53 + 3.61) + 14.91)))')
+        return
+    source = sys.stdin if args.batch == '-' else open(args.batch)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        errors = evaluate_batch(source, output, args.workers, args.chunk_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    if errors:
+        print(f'{errors} line(s) could not be evaluated', file=sys.stderr)
+
+
 if __name__ == '__main__':
-    demo('((6.63 + (56.62 + 16.8)) + (-((60.53 + 3.61) + 14.91)))')
+    main()
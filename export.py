@@ -0,0 +1,263 @@
+from abc import ABC, abstractmethod
+from csv import writer as csv_writer
+from json import dumps, loads
+from os import fsync, path
+from typing import Iterable, List, Sequence
+
+from openpyxl import Workbook
+
+# pyarrow is needed only for Parquet and Arrow exports, so it is optional
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = parquet = None
+
+
+# Sinks receive rows one by one through append() and must be closed when export is over.
+# None of them keeps already appended rows in memory (except for a small batch in columnar sinks)
+
+# xlsx sink based on write-only openpyxl workbook
+class XlsxSink:
+    def __init__(self, file_name: str, legend: Sequence[str], title: str = 'Results'):
+        self._file_name = file_name
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(title)
+        self._sheet.append(list(legend))
+
+    def append(self, row: Sequence):
+        self._sheet.append(list(row))
+
+    # write-only workbook can be saved only once, so rows reach the disk when sink is closed
+    def flush(self):
+        pass
+
+    def close(self):
+        self._workbook.save(self._file_name)
+        self._workbook.close()
+
+
+class CsvSink:
+    def __init__(self, file_name: str, legend: Sequence[str], title: str = None):
+        self._file = open(file_name, 'w', newline='', encoding='utf-8')
+        self._writer = csv_writer(self._file)
+        self._writer.writerow(legend)
+
+    def append(self, row: Sequence):
+        self._writer.writerow(row)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# base class of Arrow-based sinks: rows are gathered into batches of batch_size rows and written as record batches.
+# Column types are inferred from the first batch; columns having only empty values there become strings
+class ArrowBatchSink(ABC):
+    def __init__(self, file_name: str, legend: Sequence[str], title: str = None, batch_size: int = 65536):
+        if pyarrow is None:
+            raise ImportError(f'{self.__class__.__name__} requires pyarrow')
+        self._file_name = file_name
+        self._legend = list(legend)
+        self._batch_size = batch_size
+        self._rows: List[Sequence] = []
+        self._schema = None
+        self._writer = None
+
+    # short rows are padded with empty values, so that every column gets a value
+    def append(self, row: Sequence):
+        if len(row) < len(self._legend):
+            row = list(row) + [None] * (len(self._legend) - len(row))
+        self._rows.append(row)
+        if len(self._rows) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = list(zip(*self._rows))
+        self._rows = []
+        if self._schema is None:
+            arrays = [pyarrow.array(column) for column in columns]
+            self._schema = pyarrow.schema([
+                (name, pyarrow.string() if pyarrow.types.is_null(array.type) else array.type)
+                for name, array in zip(self._legend, arrays)
+            ])
+            self._writer = self._open_writer(self._schema)
+        arrays = [pyarrow.array(column, type=field.type) for column, field in zip(columns, self._schema)]
+        self._writer.write_batch(pyarrow.record_batch(arrays, schema=self._schema))
+
+    def close(self):
+        self.flush()
+        if self._writer is None:
+            self._schema = pyarrow.schema([(name, pyarrow.string()) for name in self._legend])
+            self._writer = self._open_writer(self._schema)
+        self._writer.close()
+
+    # writer of record batches of the concrete format
+    @abstractmethod
+    def _open_writer(self, schema):
+        pass
+
+
+class ParquetSink(ArrowBatchSink):
+    def _open_writer(self, schema):
+        return parquet.ParquetWriter(self._file_name, schema)
+
+
+# Arrow IPC file, also readable as Feather
+class ArrowSink(ArrowBatchSink):
+    def _open_writer(self, schema):
+        return pyarrow.ipc.new_file(self._file_name, schema)
+
+
+SINKS = {
+    '.xlsx': XlsxSink,
+    '.csv': CsvSink,
+    '.parquet': ParquetSink,
+    '.arrow': ArrowSink,
+    '.feather': ArrowSink,
+}
+
+
+# get sink by file extension
+def open_sink(file_name: str, legend: Sequence[str], title: str = 'Results'):
+    extension = path.splitext(file_name)[1].lower()
+    try:
+        sink_class = SINKS[extension]
+    except KeyError:
+        raise ValueError(f'unsupported export format: {extension}')
+    return sink_class(file_name, legend, title)
+
+
+# export rows (e.g. coming straight from a scraper) to a file chosen by its extension; returns number of rows
+def export_rows(rows: Iterable[Sequence], legend: Sequence[str], file_name: str, title: str = 'Results') -> int:
+    sink = open_sink(file_name, legend, title)
+    count = 0
+    try:
+        for row in rows:
+            sink.append(row)
+            count += 1
+    finally:
+        sink.close()
+    return count
+
+
+# adapter giving a sink the cell-by-cell (write, save) interface used by search.process_students.
+# Cells are gathered into rows, and save() passes all gathered rows to the sink in row order,
+# so rows must be completed before save() is called. The first header_rows rows are dropped,
+# since sinks write their header from the legend themselves. The writer still unpacks into a (write, save) pair
+class RowWriter:
+    def __init__(self, sink, header_rows: int = 1):
+        self._sink = sink
+        self._rows = {}
+        self._header_rows = header_rows
+        self._exported = header_rows
+
+    def __iter__(self):
+        return iter((self.write, self.save))
+
+    def write(self, x: int, y: int, value):
+        if y < self._header_rows:
+            return
+        elif y < self._exported:
+            raise ValueError(f'row {y} has already been exported')
+        row = self._rows.setdefault(y, [])
+        if len(row) <= x:
+            row.extend([None] * (x + 1 - len(row)))
+        row[x] = value
+
+    def save(self):
+        for y in sorted(self._rows):
+            # rows that were never written become empty rows
+            for _ in range(self._exported, y):
+                self._sink.append([])
+            self._sink.append(self._rows[y])
+            self._exported = y + 1
+        self._rows.clear()
+        self._sink.flush()
+
+    def close(self):
+        self.save()
+        self._sink.close()
+
+
+# finish writer if it needs finishing (plain (write, save) pairs do not)
+def close_writer(writer):
+    close = getattr(writer, 'close', None)
+    if close is not None:
+        close()
+
+
+# writer with the (write, save) interface that makes every save() durable by appending completed rows
+# to a line-delimited JSON journal, while the wrapped writer (e.g. an xls workbook, which is rewritten
+# as a whole on each save) is saved only every `every` rows and on close().
+# If the journal already exists, its rows are replayed into the wrapped writer and later writes
+# to these rows are ignored, so an interrupted run can be resumed from `completed` rows
+class CheckpointWriter:
+    def __init__(self, journal_name: str, writer, every: int = 100):
+        self._writer = writer
+        self._write, self._save = writer
+        self._every = every
+        self._rows = {}
+        self._journaled = set()
+        self._unsaved = 0
+        self._journal = open(journal_name, 'a+', encoding='utf-8')
+        self._replay()
+
+    def __iter__(self):
+        return iter((self.write, self.save))
+
+    # number of consecutive completed rows after the header row
+    @property
+    def completed(self) -> int:
+        row = 1
+        while row in self._journaled:
+            row += 1
+        return row - 1
+
+    def write(self, x: int, y: int, value):
+        if y not in self._journaled:
+            self._rows.setdefault(y, {})[x] = value
+
+    def save(self):
+        for y in sorted(self._rows):
+            cells = sorted(self._rows[y].items())
+            self._journal.write(dumps({'row': y, 'cells': cells}, ensure_ascii=False) + '\n')
+            self._apply(y, cells)
+        self._rows.clear()
+        self._journal.flush()
+        fsync(self._journal.fileno())
+        if self._unsaved >= self._every:
+            self._save()
+            self._unsaved = 0
+
+    def close(self):
+        self.save()
+        self._save()
+        close_writer(self._writer)
+        self._journal.close()
+
+    def _apply(self, y: int, cells):
+        for x, value in cells:
+            self._write(x, y, value)
+        self._journaled.add(y)
+        self._unsaved += 1
+
+    # replay journal; a line cut by a crash is dropped, so that new lines are appended after the last complete one
+    def _replay(self):
+        self._journal.seek(0)
+        end = 0
+        for line in iter(self._journal.readline, ''):
+            try:
+                entry = loads(line)
+            except ValueError:
+                break
+            if not line.endswith('\n'):
+                break
+            self._apply(entry['row'], entry['cells'])
+            end = self._journal.tell()
+        self._journal.seek(end)
+        self._journal.truncate()
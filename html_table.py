@@ -0,0 +1,154 @@
+from codecs import getincrementaldecoder
+from collections import namedtuple
+from html.parser import HTMLParser
+from itertools import chain
+from typing import Iterable, Iterator, List
+
+# text of a table cell and whether it contains a marking tag (<b> by default)
+Cell = namedtuple('Cell', ['text', 'marked'])
+
+# row of a table: number of the table in the document, whether the row is inside <thead>, and its cells
+TableRow = namedtuple('TableRow', ['table', 'head', 'cells'])
+
+
+# state of an open table: its number, whether its rows are inside <thead>, and the row and cell being parsed
+class _OpenTable:
+    __slots__ = ('number', 'head', 'cells', 'text', 'marked')
+
+    def __init__(self, number: int):
+        self.number = number
+        self.head = False
+        self.cells = None
+        self.text = None
+        self.marked = False
+
+
+# event-driven extractor of table rows: no document tree is built, only the text of the row being parsed
+# is kept, and completed rows are collected until the caller drains them.
+# Every open table keeps a row of its own, so a table nested into a cell neither splits the enclosing row
+# nor resets its <thead> state; as in BeautifulSoup, text and marking of the nested table belong to that cell too
+class TableRowParser(HTMLParser):
+    def __init__(self, mark: str = 'b'):
+        super().__init__()
+        self._mark = mark
+        self._tables = 0
+        # stack of open tables, the innermost one last
+        self._open: List[_OpenTable] = []
+        self.rows: List[TableRow] = []
+
+    # number of tables opened so far
+    @property
+    def tables(self) -> int:
+        return self._tables
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            self._open.append(_OpenTable(self._tables))
+            self._tables += 1
+            return
+        elif not self._open:
+            return
+        table = self._open[-1]
+        if tag == 'thead':
+            table.head = True
+        elif tag in ('tbody', 'tfoot'):
+            self._finish_row(table)
+            table.head = False
+        elif tag == 'tr':
+            self._finish_row(table)
+            table.cells = []
+        elif tag in ('td', 'th'):
+            self._finish_cell(table)
+            if table.cells is None:
+                table.cells = []
+            table.text = []
+            table.marked = False
+        elif tag == self._mark:
+            for table in self._open:
+                if table.text is not None:
+                    table.marked = True
+
+    def handle_endtag(self, tag):
+        if not self._open:
+            return
+        table = self._open[-1]
+        if tag in ('td', 'th'):
+            self._finish_cell(table)
+        elif tag == 'tr':
+            self._finish_row(table)
+        elif tag == 'thead':
+            self._finish_row(table)
+            table.head = False
+        elif tag == 'table':
+            self._finish_row(table)
+            self._open.pop()
+
+    def handle_data(self, data):
+        for table in self._open:
+            if table.text is not None:
+                table.text.append(data)
+
+    def close(self):
+        super().close()
+        while self._open:
+            self._finish_row(self._open.pop())
+
+    @staticmethod
+    def _finish_cell(table: _OpenTable):
+        if table.text is not None:
+            table.cells.append(Cell(''.join(table.text), table.marked))
+            table.text = None
+
+    def _finish_row(self, table: _OpenTable):
+        self._finish_cell(table)
+        if table.cells:
+            self.rows.append(TableRow(table.number, table.head, table.cells))
+        table.cells = None
+
+
+# rows of all tables of a document given as a sequence of text chunks, yielded while the document is parsed
+def iter_table_rows(chunks: Iterable[str], mark: str = 'b') -> Iterator[TableRow]:
+    parser = TableRowParser(mark)
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from parser.rows
+        parser.rows.clear()
+    parser.close()
+    yield from parser.rows
+
+
+# binary chunks of a stream (e.g. HTTP response) as they are read
+def iter_chunks(stream, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+    return iter(lambda: stream.read(chunk_size), b'')
+
+
+# text of binary chunks decoded on the fly
+def decode_chunks(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[str]:
+    decoder = getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+# rows of a single table of a document. For a non-negative index rows are yielded while parsing;
+# a negative index counts from the end of the document, so rows of the last -index tables
+# have to be kept (as plain strings, not as a document tree) until the end
+def extract_table(chunks: Iterable[str], index: int = -1, mark: str = 'b') -> Iterator[TableRow]:
+    parser = TableRowParser(mark)
+    kept = []
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            parser.close()
+        else:
+            parser.feed(chunk)
+        if index >= 0:
+            yield from (row for row in parser.rows if row.table == index)
+        else:
+            kept.extend(parser.rows)
+            first = parser.tables + index
+            if kept and kept[0].table < first:
+                kept = [row for row in kept if row.table >= first]
+        parser.rows.clear()
+    if index < 0:
+        wanted = parser.tables + index
+        yield from (row for row in kept if row.table == wanted)
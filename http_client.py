@@ -0,0 +1,268 @@
+from hashlib import sha1
+from http.client import HTTPConnection, HTTPSConnection, RemoteDisconnected
+from json import dumps, loads
+from os import makedirs, path, replace
+from threading import Lock, get_ident
+from time import monotonic, sleep, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from metrics import metrics
+
+
+# error raised when server responds with unexpected status
+class HttpError(Exception):
+    def __init__(self, url: str, status: int, reason: str):
+        super().__init__(f'{status} {reason}: {url}')
+        self.url = url
+        self.status = status
+
+
+# redirect statuses followed by HttpClient and the longest chain of redirects it follows, as urlopen does
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+
+# limits rate of requests to a single host by spacing them at least 1 / rate seconds apart
+class RateLimiter:
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next = 0.0
+        self._lock = Lock()
+
+    def wait(self):
+        with self._lock:
+            now = monotonic()
+            moment = max(now, self._next)
+            self._next = moment + self._interval
+        if moment > now:
+            sleep(moment - now)
+
+
+# cached response body with validators used for conditional requests; an entry used through get_parsed
+# keeps the parsed body instead of the body itself
+class CacheEntry:
+    __slots__ = ('body', 'etag', 'last_modified', 'fetched_at', 'parsed')
+
+    def __init__(self, body: Optional[bytes], etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.parsed = None
+
+
+# HTTP client keeping idle keep-alive connections per host and caching response bodies.
+# Bodies are kept in memory and, if cache_dir is given, on disk, so that later runs can reuse them.
+# A cached body younger than ttl seconds is returned without any request, an older one is revalidated
+# with If-None-Match/If-Modified-Since and is downloaded again only if server reports a change.
+# Requests to a host are limited to rate per second if rate is given; timeouts, connection errors and
+# server errors are retried up to retries times with exponential backoff. Redirects are followed, and the
+# final body is cached under the requested url.
+# Bodies fetched through get_parsed are cached in parsed form only (see get_parsed).
+# Requests are measured as the fetch stage of shared metrics, and cache outcomes and retries are counted there too.
+# The client is thread-safe
+class HttpClient:
+    def __init__(self, cache_dir: str = None, ttl: float = 3600, timeout: float = 15,
+                 rate: float = None, retries: int = 0, backoff: float = 0.5):
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._timeout = timeout
+        self._rate = rate
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._retries = retries
+        self._backoff = backoff
+        self._idle: Dict[Tuple[str, str], List[HTTPConnection]] = {}
+        self._memory: Dict[str, CacheEntry] = {}
+        self._url_locks: Dict[str, Lock] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.retried = 0
+        if cache_dir is not None:
+            makedirs(cache_dir, exist_ok=True)
+
+    # get response body, from cache if possible;
+    # concurrent requests for the same url wait for the first one instead of downloading it again
+    def get(self, url: str, timeout: float = None) -> bytes:
+        with self._url_lock(url):
+            return self._get(url, timeout, True)[0].body
+
+    # get response body converted by parse (the same function for a given url). The parsed value is cached
+    # in place of the body and follows its freshness: it is reused while the body is fresh or revalidated,
+    # and the body is parsed anew once server sends a changed one. The body itself stays only in the disk cache
+    def get_parsed(self, url: str, parse: Callable[[bytes], Any], timeout: float = None):
+        with self._url_lock(url):
+            entry, changed = self._get(url, timeout, False)
+            if changed or entry.parsed is None:
+                entry.parsed = parse(entry.body)
+                entry.body = None
+            return entry.parsed
+
+    def _url_lock(self, url: str) -> Lock:
+        with self._lock:
+            return self._url_locks.setdefault(url, Lock())
+
+    # cache entry for url and whether its body has just been downloaded
+    def _get(self, url: str, timeout: float, need_body: bool) -> Tuple[CacheEntry, bool]:
+        entry = self._lookup(url, need_body)
+        if entry is not None and time() - entry.fetched_at < self._ttl:
+            with self._lock:
+                self.hits += 1
+            metrics.count('http_cache_hits')
+            return entry, False
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        status, reason, response_headers, body = self._follow(url, headers, timeout)
+        if status == 304 and entry is not None:
+            entry.fetched_at = time()
+            with self._lock:
+                self.revalidated += 1
+            metrics.count('http_cache_revalidated')
+            self._store(url, entry, body_changed=False)
+            return entry, False
+        elif status == 200:
+            entry = CacheEntry(body, response_headers.get('etag'), response_headers.get('last-modified'), time())
+            with self._lock:
+                self.misses += 1
+            metrics.count('http_cache_misses')
+            self._store(url, entry)
+            return entry, True
+        raise HttpError(url, status, reason)
+
+    # response to a request for url, following redirects to any location
+    def _follow(self, url: str, headers: dict, timeout: float = None):
+        location = url
+        for _ in range(MAX_REDIRECTS + 1):
+            status, reason, response_headers, body = self._retry(location, headers, timeout)
+            if status not in REDIRECT_STATUSES or 'location' not in response_headers:
+                break
+            location = urljoin(location, response_headers['location'])
+        else:
+            raise HttpError(url, status, 'too many redirects')
+        return status, reason, response_headers, body
+
+    # response to a single request, retried on timeouts, connection errors and server errors
+    def _retry(self, url: str, headers: dict, timeout: float = None):
+        for attempt in range(self._retries + 1):
+            try:
+                with metrics.stage('fetch') as stage:
+                    status, reason, response_headers, body = self._request(url, headers, timeout)
+                    stage.add(bytes=len(body))
+                if status < 500 or attempt == self._retries:
+                    return status, reason, response_headers, body
+            except (TimeoutError, ConnectionError):
+                if attempt == self._retries:
+                    raise
+            with self._lock:
+                self.retried += 1
+            metrics.count('http_retries')
+            sleep(self._backoff * 2 ** attempt)
+
+    # close all idle connections
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _request(self, url: str, headers: dict, timeout: float = None):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        if self._rate is not None:
+            with self._lock:
+                limiter = self._limiters.setdefault(parts.netloc, RateLimiter(self._rate))
+            limiter.wait()
+        # a pooled connection may have been closed by server meanwhile, so retry once with a fresh one
+        for attempt in range(2):
+            connection, reused = self._acquire(key, timeout)
+            try:
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            response_headers = {name.lower(): value for name, value in response.getheaders()}
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            return response.status, response.reason, response_headers, body
+
+    def _acquire(self, key: Tuple[str, str], timeout: float = None):
+        timeout = self._timeout if timeout is None else timeout
+        with self._lock:
+            connections = self._idle.get(key)
+            connection = connections.pop() if connections else None
+        if connection is None:
+            scheme, netloc = key
+            connection_class = HTTPSConnection if scheme == 'https' else HTTPConnection
+            return connection_class(netloc, timeout=timeout), False
+        # the timeout attribute is only read on connect, so the socket of a reused connection is set directly
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def _release(self, key: Tuple[str, str], connection: HTTPConnection):
+        if connection.sock is not None:
+            connection.sock.settimeout(self._timeout)
+        with self._lock:
+            self._idle.setdefault(key, []).append(connection)
+
+    def _disk_path(self, url: str) -> str:
+        return path.join(self._cache_dir, sha1(url.encode()).hexdigest())
+
+    # an entry whose body was replaced by its parsed value is not enough when body is needed,
+    # so then the body is read from the disk cache, or is downloaded anew without one
+    def _lookup(self, url: str, need_body: bool = True) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._memory.get(url)
+        if entry is not None and need_body and entry.body is None:
+            entry = None
+        if entry is not None or self._cache_dir is None:
+            return entry
+        name = self._disk_path(url)
+        try:
+            with open(name + '.json') as fp:
+                meta = loads(fp.read())
+            with open(name + '.body', 'rb') as fp:
+                body = fp.read()
+        except (OSError, ValueError):
+            return None
+        entry = CacheEntry(body, meta.get('etag'), meta.get('last_modified'), meta.get('fetched_at', 0))
+        with self._lock:
+            self._memory[url] = entry
+        return entry
+
+    def _store(self, url: str, entry: CacheEntry, body_changed: bool = True):
+        with self._lock:
+            self._memory[url] = entry
+        if self._cache_dir is None:
+            return
+        name = self._disk_path(url)
+        # write to temporary files and rename, so that an interrupted run never leaves a broken entry
+        temporary = f'.{get_ident()}.tmp'
+        if body_changed:
+            with open(name + '.body' + temporary, 'wb') as fp:
+                fp.write(entry.body)
+            replace(name + '.body' + temporary, name + '.body')
+        meta = {'url': url, 'etag': entry.etag, 'last_modified': entry.last_modified, 'fetched_at': entry.fetched_at}
+        with open(name + '.json' + temporary, 'w') as fp:
+            fp.write(dumps(meta))
+        replace(name + '.json' + temporary, name + '.json')
@@ -0,0 +1,62 @@
+from collections import namedtuple
+from hashlib import sha1
+from json import dumps
+from typing import Dict, Iterable, List
+
+from openpyxl import load_workbook
+
+# difference between two versions of a processed admission table: added and modified rows,
+# and numbers (the '№' column) of removed rows
+ChangeSet = namedtuple('ChangeSet', ['added', 'removed', 'modified'])
+
+
+def has_changes(changes: ChangeSet) -> bool:
+    return bool(changes.added or changes.removed or changes.modified)
+
+
+# hash of row values; numpy values of rows loaded from the table cache are converted to plain ones first
+def row_hash(row) -> str:
+    keys = sorted(row.dtype.names) if hasattr(row, 'dtype') else sorted(row)
+    values = [row[key].item() if hasattr(row[key], 'item') else row[key] for key in keys]
+    return sha1(dumps(values, ensure_ascii=False).encode()).hexdigest()
+
+
+# compare tables row by row, matching rows by applicant number
+def diff_tables(old: Iterable, new: Iterable[Dict]) -> ChangeSet:
+    old_hashes = {int(row['number']): row_hash(row) for row in old}
+    added, modified = [], []
+    seen = set()
+    for row in new:
+        number = row['number']
+        seen.add(number)
+        if number not in old_hashes:
+            added.append(row)
+        elif old_hashes[number] != row_hash(row):
+            modified.append(row)
+    removed = [number for number in old_hashes if number not in seen]
+    return ChangeSet(added, removed, modified)
+
+
+# apply change set to an xlsx file written by parser.save_to_excel: modified rows are rewritten cell by cell,
+# removed rows are deleted and added rows are appended, other rows are left as they are.
+# The xlsx format still requires the whole file to be written again on save
+def patch_excel(file_name: str, legend: List[str], changes: ChangeSet):
+    workbook = load_workbook(file_name)
+    sheet = workbook.active
+    number_column = legend.index('number')
+    rows = {}
+    for index, values in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        rows[values[number_column]] = index
+    for row in changes.modified:
+        index = rows.get(row['number'])
+        if index is None:
+            sheet.append([row[key] for key in legend])
+            continue
+        for column, key in enumerate(legend, start=1):
+            sheet.cell(index, column, row[key])
+    for index in sorted((rows[number] for number in changes.removed if number in rows), reverse=True):
+        sheet.delete_rows(index)
+    for row in changes.added:
+        sheet.append([row[key] for key in legend])
+    workbook.save(file_name)
+    workbook.close()
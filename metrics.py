@@ -0,0 +1,196 @@
+from json import dumps
+from os import environ
+from threading import Lock, local
+from time import perf_counter, time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+
+# accumulated measurements of a pipeline stage
+class StageStats:
+    __slots__ = ('calls', 'seconds', 'bytes', 'rows', 'errors')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+# a running measurement of a stage, used as a context manager; bytes and rows are added while it runs
+class Stage:
+    __slots__ = ('_metrics', '_name', 'bytes', 'rows')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self._metrics = metrics
+        self._name = name
+        self.bytes = 0
+        self.rows = 0
+
+    def add(self, bytes: int = 0, rows: int = 0):
+        self.bytes += bytes
+        self.rows += rows
+
+    def __enter__(self):
+        self._metrics._start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._metrics._finish(self._name, self.bytes, self.rows, exc_type is not None)
+        return False
+
+
+# stand-in returned while metrics are disabled: entering, leaving and adding to it does nothing
+class NullStage:
+    __slots__ = ()
+
+    def add(self, bytes: int = 0, rows: int = 0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+# Collector of stage timings (wall time, bytes, rows, errors) and counters (cache hits, retries, ...).
+# Stage time is exclusive: time spent in a stage nested into another one (e.g. decoding chunks pulled
+# by the HTML parser) is not counted twice. While disabled, stage() returns a shared no-op object and
+# iterate() returns the iterable itself, so instrumented code runs at nearly full speed
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._stages: Dict[str, StageStats] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = Lock()
+        # per-thread stack of [start, time of nested stages] of the running stages
+        self._local = local()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def stage(self, name: str):
+        return Stage(self, name) if self.enabled else NULL_STAGE
+
+    # measure time spent in producing items of iterable as stage `name`; every item counts as a row
+    # unless rows is false (e.g. for chunks of a byte stream), and if size is given, it is used to count
+    # bytes of items (outside of the measured time)
+    def iterate(self, name: str, iterable: Iterable, size: Callable = None, rows: bool = True) -> Iterable:
+        if not self.enabled:
+            return iterable
+        return self._iterate(name, iterable, size, rows)
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'stages': {name: stats.as_dict() for name, stats in self._stages.items()},
+                'counters': dict(self._counters),
+            }
+
+    # one JSON line per stage and per counter
+    def write_json_lines(self, fp):
+        snapshot = self.snapshot()
+        timestamp = time()
+        for name, stats in snapshot['stages'].items():
+            fp.write(dumps({'time': timestamp, 'stage': name, **stats}) + '\n')
+        for name, value in snapshot['counters'].items():
+            fp.write(dumps({'time': timestamp, 'counter': name, 'value': value}) + '\n')
+
+    # Prometheus text exposition format, e.g. for node exporter textfile collector
+    def write_prometheus(self, fp, prefix: str = 'scraper'):
+        snapshot = self.snapshot()
+        for key in StageStats.__slots__:
+            metric = f'{prefix}_stage_{key}_total'
+            fp.write(f'# TYPE {metric} counter\n')
+            for name, stats in snapshot['stages'].items():
+                fp.write(f'{metric}{{stage="{name}"}} {stats[key]}\n')
+        metric = f'{prefix}_events_total'
+        fp.write(f'# TYPE {metric} counter\n')
+        for name, value in snapshot['counters'].items():
+            fp.write(f'{metric}{{event="{name}"}} {value}\n')
+
+    # write collected metrics to file: Prometheus text for .prom files, JSON lines otherwise
+    def dump(self, file_name: str):
+        if file_name.endswith('.prom'):
+            with open(file_name, 'w') as fp:
+                self.write_prometheus(fp)
+        else:
+            with open(file_name, 'a') as fp:
+                self.write_json_lines(fp)
+
+    def _iterate(self, name: str, iterable: Iterable, size: Callable = None, rows: bool = True) -> Iterator:
+        iterator = iter(iterable)
+        while True:
+            self._start()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._finish(name, 0, 0, False, call=False)
+                return
+            except BaseException:
+                self._finish(name, 0, 0, True)
+                raise
+            self._finish(name, 0, int(rows), False)
+            if size is not None:
+                self._record(name, 0.0, size(item), 0, False, False)
+            yield item
+
+    def _running(self) -> list:
+        running = getattr(self._local, 'running', None)
+        if running is None:
+            running = self._local.running = []
+        return running
+
+    def _start(self):
+        self._running().append([perf_counter(), 0.0])
+
+    def _finish(self, name: str, size: int, rows: int, error: bool, call: bool = True):
+        running = self._running()
+        start, nested = running.pop()
+        elapsed = perf_counter() - start
+        if running:
+            running[-1][1] += elapsed
+        self._record(name, elapsed - nested, size, rows, error, call)
+
+    def _record(self, name: str, seconds: float, size: int, rows: int, error: bool, call: bool):
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = StageStats()
+            stats.calls += call
+            stats.seconds += seconds
+            stats.bytes += size
+            stats.rows += rows
+            stats.errors += error
+
+
+# metrics shared by the whole pipeline; disabled unless enabled explicitly (e.g. by a --metrics option)
+metrics = Metrics()
+
+# environment variable naming the file to dump metrics to, for runs without command line options
+METRICS_VARIABLE = 'SCRAPER_METRICS'
+
+
+# enable shared metrics if a file to dump them to is given (or named by the environment variable); returns its name
+def enable_metrics(file_name: str = None) -> Optional[str]:
+    file_name = file_name or environ.get(METRICS_VARIABLE)
+    if file_name:
+        metrics.enable()
+    return file_name
@@ -1,105 +1,188 @@
 import pdb
+from argparse import ArgumentParser
 from http.client import HTTPResponse
-from os import listdir, curdir
-from pickle import dump, load
-from typing import List, Dict, Union
-from urllib.request import urlopen
-from openpyxl import Workbook
-
-# noinspection PyProtectedMember
-from bs4 import BeautifulSoup, Tag, NavigableString
+from os import environ, path
+from typing import List, Dict, Iterable, Iterator, Optional, Union
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from export import export_rows
+from html_table import Cell, decode_chunks, extract_table, iter_chunks
+from incremental import ChangeSet, diff_tables, has_changes, patch_excel
+from metrics import enable_metrics, metrics
+from table_cache import TableCache
 
 Row = Dict[str, Union[int, str, bool]]
 Table = List[Row]
+RawRow = Dict[str, Cell]
 
 
-def parse_site(file=None):
-    url = f'http://admlist.ru/bmstu/5ab880e599b84419489cf11bcf04e3c8.html'
-    response: HTTPResponse = urlopen(url)
-    print('Got response. Converting...', file=file)
-
-    text = response.read().decode()
-    print('Converted response text to string. Processing...', file=file)
-
-    bs = BeautifulSoup(text, features="html.parser")
-    print('Made BeautifulSoup. Searching for table...', file=file)
-
-    table: Tag = bs.find_all('table')[-1]
-    print('Got table. Parsing table legend...', file=file)
-
-    head: Tag = table.thead
-    head_row: Tag = head.tr
-    legend: List[Tag] = [cell for cell in head_row.children]
-    print('Parsed legend. Parsing table body...', file=file)
-
-    body: Tag = table.tbody
-    result: List[Dict[str, Tag]] = list()
-    for row in body.children:
-        if type(row) == NavigableString:
-            continue
-        tr: Tag = row
-        list_row: Dict[str, Tag] = dict()
-        for index, cell in enumerate(tr.children):
-            td: Tag = cell
-            list_row[legend[index].text] = td
-        if len(list_row) == 0:
-            continue
-        result.append(list_row)
-    print('Parsed body. Returning result.', file=file)
+# root of the admission lists site; $ADMLIST_URL may point it elsewhere, e.g. to a local stand-in server
+BASE_URL = environ.get('ADMLIST_URL', 'http://admlist.ru')
+SITE_PATH = '/bmstu/5ab880e599b84419489cf11bcf04e3c8.html'
 
-    return result
+
+# request admission list page; headers may carry validators for a conditional request
+def open_site(headers: Dict[str, str] = None) -> HTTPResponse:
+    with metrics.stage('fetch'):
+        return urlopen(Request(BASE_URL + SITE_PATH, headers=headers or {}))
+
+
+# size of decoded text in bytes, for metrics of the decode stage
+def _encoded_size(text: str) -> int:
+    return len(text.encode())
+
+
+# stream rows of the last table of the admission list page: the page is decoded and parsed chunk by chunk,
+# and each row is yielded as a dict of plain text cells keyed by the legend, without building a document tree.
+# Reading, decoding, parsing and extraction of rows are measured as separate stages
+def iter_site(file=None, response: HTTPResponse = None) -> Iterator[RawRow]:
+    if response is None:
+        response = open_site()
+    print('Got response. Parsing table...', file=file)
+
+    chunks = metrics.iterate('fetch', iter_chunks(response), len, rows=False)
+    text = metrics.iterate('decode', decode_chunks(chunks), _encoded_size, rows=False)
+    rows = metrics.iterate('html_parse', extract_table(text, -1))
+    legend: List[str] = []
+    for row in rows:
+        with metrics.stage('table_extract') as stage:
+            if row.head:
+                if not legend:
+                    legend = [cell.text for cell in row.cells]
+                    print('Parsed legend. Parsing table body...', file=file)
+                continue
+            stage.add(rows=1)
+            raw = dict(zip(legend, row.cells))
+        yield raw
+    print('Parsed body.', file=file)
 
 
-def process_table(raw: List[Dict[str, Tag]]):
+def parse_site(file=None) -> List[RawRow]:
+    return list(iter_site(file))
+
+
+# rows are processed one by one, so raw rows may come straight from iter_site
+def process_table(raw: Iterable[RawRow]):
     result: Table = list()
-    for row in raw:
-        result_row: Row = dict()
-        result_row['name'] = row['ФИО'].text
-        result_row['number'] = int(row['№'].text)
-        result_row['accept_here'] = row['Согл'].text == 'Да'
-        result_row['type'] = row['Тип'].text
-        result_row['sum'] = row['∑'].text
-        result_row['accept_else'] = row['Другие ОП'].find('b') is not None
-        result.append(result_row)
+    with metrics.stage('row_processing') as stage:
+        for row in raw:
+            result_row: Row = dict()
+            result_row['name'] = row['ФИО'].text
+            result_row['number'] = int(row['№'].text)
+            result_row['accept_here'] = row['Согл'].text == 'Да'
+            result_row['type'] = row['Тип'].text
+            result_row['sum'] = row['∑'].text
+            result_row['accept_else'] = row['Другие ОП'].marked
+            result.append(result_row)
+        stage.add(rows=len(result))
     return result
 
 
-def save_to_excel(table: Table, legend: List[str], file_name: str):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Results"
-    for horizontal, key in enumerate(legend):
-        ws.cell(1, 1 + horizontal, key)
-    for vertical, row in enumerate(table):
-        for horizontal, key in enumerate(legend):
-            ws.cell(2 + vertical, 1 + horizontal, row[key])
-    wb.save(file_name)
-    wb.close()
+# incrementally refresh cached table: the page is requested conditionally with validators saved in the cache,
+# and if it has changed, the new table is compared with the cached one and only changed rows are patched
+# in the cache. Returns the change set, or None if there was no valid cache to compare with
+def refresh(cache: TableCache, file=None) -> Optional[ChangeSet]:
+    meta = cache.metadata() or {}
+    valid = cache.is_fresh()
+    headers = {}
+    if valid and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if valid and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        response = open_site(headers)
+    except HTTPError as e:
+        if e.code != 304:
+            raise
+        print('Page is not modified.', file=file)
+        metrics.count('page_not_modified')
+        return ChangeSet([], [], [])
+    table = process_table(iter_site(file, response))
+    validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+    if not valid:
+        cache.save(table, validators)
+        return None
+    changes = diff_tables(cache.load(), table)
+    cache.patch(table, changes, validators)
+    return changes
+
+
+# rows are streamed to the file (xlsx, csv, parquet or arrow, chosen by extension) as they come,
+# so table may be any iterable of rows, e.g. a generator fed by the scraper
+def save_to_excel(table: Iterable[Row], legend: List[str], file_name: str):
+    with metrics.stage('export') as stage:
+        stage.add(rows=export_rows(([row[key] for key in legend] for row in table), legend, file_name, 'Results'))
 
 
 def main():
-    file_name = 'iu7'
-    pickle_name = f'{file_name}.pickle'
-    xlsx_name = f'{file_name}.xlsx'
-    load_flag: bool = False
-    if pickle_name in listdir(curdir):
-        load_flag = input('There is a data for this one. Should I use it(y/n)? ').strip() == 'y'
+    arguments = ArgumentParser(description='Download admission list and save it to Excel')
+    arguments.add_argument('--name', default='iu7', help='base name of the local cache and the xlsx file')
+    arguments.add_argument('--cache', choices=['ask', 'use', 'refresh', 'auto'], default='ask',
+                           help='ask: prompt whether to use local cache; use: always use it if it is valid; '
+                                'refresh: always download; auto: use it if it is not older than --max-age. '
+                                'Any choice except ask runs without prompts')
+    arguments.add_argument('--max-age', type=float, default=3600, help='cache freshness limit in seconds for auto')
+    arguments.add_argument('--incremental', action='store_true',
+                           help='refresh cache with a conditional request and patch only changed rows, without prompts')
+    arguments.add_argument('--metrics', metavar='FILE',
+                           help='record stage timings and counters and write them to FILE: Prometheus text '
+                                'for .prom files, JSON lines otherwise (also enabled by $SCRAPER_METRICS)')
+    args = arguments.parse_args()
+
+    metrics_file = enable_metrics(args.metrics)
+    try:
+        run(args)
+    finally:
+        if metrics_file:
+            metrics.dump(metrics_file)
+
+
+def run(args):
+    cache = TableCache(args.name)
+    xlsx_name = f'{args.name}.xlsx'
+    legend = ['number', 'name', 'type', 'sum', 'accept_here', 'accept_else']
+    if args.incremental:
+        changes = refresh(cache)
+        if changes is None or not path.exists(xlsx_name):
+            print('Saving to Excel...')
+            save_to_excel(cache.load(), legend, xlsx_name)
+        elif has_changes(changes):
+            print(f'{len(changes.added)} added, {len(changes.removed)} removed, '
+                  f'{len(changes.modified)} modified. Patching Excel...')
+            with metrics.stage('export') as stage:
+                patch_excel(xlsx_name, legend, changes)
+                stage.add(rows=len(changes.added) + len(changes.modified))
+        else:
+            print('No changes.')
+        return
 
+    load_flag: bool = False
+    if args.cache == 'ask':
+        if cache.is_fresh():
+            load_flag = input('There is a data for this one. Should I use it(y/n)? ').strip() == 'y'
+    elif args.cache == 'use':
+        load_flag = cache.is_fresh()
+    elif args.cache == 'auto':
+        load_flag = cache.is_fresh(args.max_age)
+
+    metrics.count('table_cache_hits' if load_flag else 'table_cache_misses')
     if load_flag:
         print('Reading data from local copy...')
-        with open(pickle_name, 'rb') as fp:
-            table = load(fp)
+        table = cache.load()
     else:
         print('Reading data from outer source...')
-        table = process_table(parse_site())
-        with open(pickle_name, 'wb+') as fp:
-            dump(table, fp)
+        table = process_table(iter_site())
+        try:
+            cache.save(table)
+        except ImportError as e:
+            print(f'Local copy is not saved: {e}')
 
     print('Data loaded. Saving to Excel...')
-    legend = ['number', 'name', 'type', 'sum', 'accept_here', 'accept_else']
     save_to_excel(table, legend, xlsx_name)
 
-    if input('Data saved. Do you want to continue(y/n)? ') == 'y':
+    if args.cache != 'ask':
+        print('Data saved.')
+    elif input('Data saved. Do you want to continue(y/n)? ') == 'y':
         print('Enjoy!')
         # noinspection PyBroadException
         try:
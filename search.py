@@ -1,11 +1,20 @@
-from urllib.request import urlopen
+from os import environ
 from urllib.parse import quote
 from hashlib import md5
 from json import loads
-from bs4 import BeautifulSoup
 from xlrd import open_workbook
 from xlwt import Workbook
 from itertools import count
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Executor
+from http_client import HttpClient
+from html_table import iter_table_rows
+from export import CheckpointWriter, RowWriter, close_writer, open_sink
+from metrics import enable_metrics, metrics
+
+
+# root of the admission lists site; $ADMLIST_URL may point it elsewhere, e.g. to a local stand-in server
+BASE_URL = environ.get('ADMLIST_URL', 'http://admlist.ru')
 
 
 # error raised when there is literally no data
@@ -13,6 +22,11 @@ class NoDataError(Exception):
     pass
 
 
+# shared client: keeps keep-alive connections and caches shards and contest pages, so that
+# a run fetches each of them at most once
+default_client = HttpClient()
+
+
 def get_subjects():
     return ['рус', 'мат', 'инф', 'физ']
 
@@ -22,51 +36,124 @@ def get_hash(name: str) -> str:
     return md5(name.encode()).hexdigest()
 
 
+# decode a json response body, measured as the decode stage
+def decode_json(body: bytes):
+    with metrics.stage('decode') as stage:
+        stage.add(bytes=len(body))
+        return loads(body.decode())
+
+
 # get url of json file containing information about all students whose hash starts with 2 certain digits
 def get_search_query(name_hash: str) -> str:
-    return f"http://admlist.ru/fio/{name_hash[:2]}.json"
+    return f"{BASE_URL}/fio/{name_hash[:2]}.json"
 
 
 # search for all registered applications made by student
-def search(name: str, timeout=15):
+def search(name: str, timeout=15, client: HttpClient = None):
     name_hash = get_hash(name)
     query = get_search_query(name_hash)
     try:
-        return loads(urlopen(query, timeout=timeout).read().decode())[name_hash]
+        return decode_json((client or default_client).get(query, timeout))[name_hash]
     except KeyError:
         raise NoDataError
     except TimeoutError:
         raise NoDataError
 
 
+# search for applications of many students at once: names are grouped by their shard, and each shard is
+# fetched and decoded only once (concurrently, if executor is given). Students without data get None;
+# as with a single student, a shard that fails to load for any reason leaves its students without data
+def search_many(names, timeout=15, client: HttpClient = None, executor: Executor = None):
+    groups = {}
+    for name in names:
+        name_hash = get_hash(name)
+        groups.setdefault(get_search_query(name_hash), []).append((name, name_hash))
+
+    def resolve(group):
+        query, members = group
+        try:
+            shard = decode_json((client or default_client).get(query, timeout))
+        except BaseException as e:
+            metrics.count('shard_errors')
+            print(f'{query}: {e}')
+            shard = {}
+        return [(name, shard.get(name_hash)) for name, name_hash in members]
+
+    result = {}
+    for resolved in (executor.map if executor else map)(resolve, groups.items()):
+        result.update(resolved)
+    return result
+
+
 # get url of html file containing table of all students participating in certain contest
 def get_list_query(contest: str):
-    return f"http://admlist.ru/{contest}.html"
+    return f"{BASE_URL}/{contest}.html"
+
+
+# parse contest page into a table of rows keyed by student's full name; rows are dicts keyed by the legend
+# taken from the first table head of the page. If legend has no full name column, a row can be found by text
+# of any of its cells. As with a document search, the first row containing the name wins
+def parse_contest_table(html: str):
+    legend = None
+    name_column = None
+    table = {}
+    with metrics.stage('table_extract') as stage:
+        for row in metrics.iterate('html_parse', iter_table_rows([html])):
+            values = [cell.text for cell in row.cells]
+            if row.head:
+                if legend is None:
+                    legend = values
+                    name_column = legend.index('ФИО') if 'ФИО' in legend else None
+                continue
+            stage.add(rows=1)
+            result = dict(zip(legend or [], values))
+            keys = values if name_column is None else values[name_column:name_column + 1]
+            for key in keys:
+                table.setdefault(key, result)
+    return table
+
+
+# contest table parsed from a contest page; the parsed table is cached by the client in place of the page
+# and follows the page's freshness, so a long-lived process sees updated contest pages
+def get_contest_table(contest: str, client: HttpClient = None):
+    return (client or default_client).get_parsed(get_list_query(contest), parse_contest_page)
+
+
+def parse_contest_page(body: bytes):
+    metrics.count('contest_table_parses')
+    with metrics.stage('decode') as stage:
+        stage.add(bytes=len(body))
+        html = body.decode()
+    return parse_contest_table(html)
 
 
 # process certain application
-def process(name, application):
+def process(name, application, client: HttpClient = None):
     contest = application[0]
-    query = get_list_query(contest)
-    bs = BeautifulSoup(urlopen(query).read().decode(), features="html.parser")
-    legend = [child.text for child in bs.thead.tr.children]
-    row = bs.find("td", text=name).parent
-    values = [child.text for child in row.children]
-    result = {}
-    for key, value in zip(legend, values):
-        result[key] = value
-    return result
+    try:
+        return dict(get_contest_table(contest, client)[name])
+    except KeyError:
+        raise NoDataError(f'{name} is not found in {contest}')
 
 
-# process all student's applications
-def process_applications(name):
+# process all student's applications; if executor is given, applications are processed concurrently in it.
+# Applications already found by search_many may be passed in resolved
+def process_applications(name, client: HttpClient = None, executor: Executor = None, resolved: dict = None):
     result = {subject: None for subject in get_subjects()}
-    try:
-        search_result = search(name)
-    except NoDataError:
-        return result
-    for application in search_result:
-        new_data = process(name, application)
+    if resolved is not None:
+        search_result = resolved.get(name)
+        if search_result is None:
+            return result
+    else:
+        try:
+            search_result = search(name, client=client)
+        except NoDataError:
+            return result
+    if executor is None:
+        applications_data = (process(name, application, client) for application in search_result)
+    else:
+        applications_data = executor.map(lambda application: process(name, application, client), search_result)
+    for new_data in applications_data:
         print(f"\t\t{new_data}")
         for k in result:
             if not result[k] and new_data.get(k):
@@ -74,10 +161,9 @@ def process_applications(name):
     return result
 
 
-def get_search_page(name: str):
+def get_search_page(name: str, client: HttpClient = None):
     query = '+'.join(map(quote, name.split(' ')))
-    r = urlopen(f"http://admlist.ru/search.html?fio={query}")
-    return r.read().decode()
+    return (client or default_client).get(f"{BASE_URL}/search.html?fio={query}").decode()
 
 
 def students_generator(file_name: str, sheet_name: str = 'Бюджетники', start: int = 0):
@@ -95,33 +181,98 @@ def get_xlsx_writer(file_name):
     return lambda x, y, v: worksheet.write(y, x, v), lambda: workbook.save(file_name)
 
 
-def process_students(generator, counter=None, writer=get_xlsx_writer('result.xls')):
-    if counter is None:
-        counter = count(0, 1)
-    write, save = writer
-    subjects = get_subjects()
+# get a streaming writer with the same (write, save) interface; the format (xlsx, csv, parquet or arrow)
+# is chosen by extension, and unlike xls there is no limit on the number of rows.
+# Rows are passed to the file on save(), the file is finished by close()
+def get_streaming_writer(file_name):
+    legend = ['номер', 'имя'] + get_subjects()
+    return RowWriter(open_sink(file_name, legend, 'Аспиранты'))
+
+
+def write_header(write):
     write(0, 0, 'номер')
     write(1, 0, 'имя')
-    for index, subject in enumerate(subjects):
+    for index, subject in enumerate(get_subjects()):
         write(2 + index, 0, subject)
-    for student_number, student_name in zip(counter, generator):
-        try:
-            result = process_applications(student_name)
-        except BaseException as e:
-            print(e)
-            result = {subject: None for subject in get_subjects()}
-        print(f"{student_number}: {student_name}\t{result}")
+
+
+def write_student(write, student_number, student_name, result):
+    print(f"{student_number}: {student_name}\t{result}")
+    with metrics.stage('export') as stage:
         write(0, 1 + student_number, student_number)
         write(1, 1 + student_number, student_name)
-        for index, subject in enumerate(subjects):
+        for index, subject in enumerate(get_subjects()):
             try:
                 score = int(result[subject])
             except TypeError:
                 score = None
             write(2 + index, 1 + student_number, score)
+        stage.add(rows=1)
+
+
+# save written rows, measured as a part of the export stage
+def save_rows(save):
+    with metrics.stage('export'):
         save()
 
 
+# process student's applications, never failing: on any error student gets no scores
+def process_student(student_name, client: HttpClient = None, executor: Executor = None, resolved: dict = None):
+    with metrics.stage('row_processing') as stage:
+        stage.add(rows=1)
+        try:
+            return process_applications(student_name, client, executor, resolved)
+        except BaseException as e:
+            metrics.count('student_errors')
+            print(e)
+            return {subject: None for subject in get_subjects()}
+
+
+def process_students(generator, counter=None, writer=get_xlsx_writer('result.xls')):
+    if counter is None:
+        counter = count(0, 1)
+    write, save = writer
+    write_header(write)
+    for student_number, student_name in zip(counter, generator):
+        write_student(write, student_number, student_name, process_student(student_name))
+        save_rows(save)
+    close_writer(writer)
+
+
+# concurrent version of process_students: up to `concurrency` students are processed at once, while their
+# contest pages are fetched in a separate pool of `fetchers` threads. Rows are still written in student order.
+# With bulk_search the whole roster is read up front and resolved by search_many, shard by shard.
+# Rate limiting and retries are configured on the client
+def process_students_concurrently(generator, counter=None, writer=None, client: HttpClient = None,
+                                  concurrency: int = 8, fetchers: int = 16, bulk_search: bool = True):
+    if counter is None:
+        counter = count(0, 1)
+    writer = writer or get_xlsx_writer('result.xls')
+    write, save = writer
+    write_header(write)
+    pending = deque()
+
+    def write_oldest():
+        student_number, student_name, future = pending.popleft()
+        write_student(write, student_number, student_name, future.result())
+        save_rows(save)
+
+    # students wait for their applications in the fetch pool, so the two pools must be separate
+    with ThreadPoolExecutor(fetchers) as fetch_pool, ThreadPoolExecutor(concurrency) as student_pool:
+        resolved = None
+        if bulk_search:
+            generator = list(generator)
+            resolved = search_many(generator, client=client, executor=fetch_pool)
+        for student_number, student_name in zip(counter, generator):
+            future = student_pool.submit(process_student, student_name, client, fetch_pool, resolved)
+            pending.append((student_number, student_name, future))
+            if len(pending) >= 2 * concurrency:
+                write_oldest()
+        while pending:
+            write_oldest()
+    close_writer(writer)
+
+
 def demo():
     name = 'Богатюк Елизавета Сергеевна'
     print(process_applications(name))
@@ -129,5 +280,16 @@ def demo():
 
 if __name__ == '__main__':
     # process_students(students_generator('enr-site-list-first-Moscow.xlsx'))
-    process_students(students_generator('source_inf.xlsx', 'Абитуриенты на 01.03.02', 0),
-                     writer=get_xlsx_writer('result_inf.xls'))
+    # rows are journaled, so that an interrupted run continues from the last completed student;
+    # stage metrics are written to the file named by $SCRAPER_METRICS, if it is set
+    metrics_file = enable_metrics()
+    checkpoint = CheckpointWriter('result_inf.journal', get_streaming_writer('result_inf.xlsx'))
+    try:
+        process_students_concurrently(students_generator('source_inf.xlsx', 'Абитуриенты на 01.03.02',
+                                                         checkpoint.completed),
+                                      counter=count(checkpoint.completed),
+                                      writer=checkpoint,
+                                      client=HttpClient(rate=20, retries=3))
+    finally:
+        if metrics_file:
+            metrics.dump(metrics_file)
@@ -0,0 +1,108 @@
+from json import dumps, loads
+from os import replace
+from time import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# numpy is needed only to keep a local copy of the table, so it is optional
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# version of the cached table layout; caches of other versions are treated as missing
+SCHEMA_VERSION = 1
+
+# columns of a processed admission table (see parser.process_table) and their kinds
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ('number', 'int'),
+    ('name', 'str'),
+    ('type', 'str'),
+    ('sum', 'str'),
+    ('accept_here', 'bool'),
+    ('accept_else', 'bool'),
+)
+
+
+# local columnar cache of a processed table: rows are stored as a numpy structured array in <name>.npy,
+# which is memory-mapped on load instead of being rebuilt row by row, and metadata (schema version,
+# creation time, number of rows) is kept next to it in <name>.json.
+# Records of the loaded array support row['name'] access just as the dicts of the processed table do.
+# Without numpy there is never a usable cache, and saving or loading one raises ImportError
+class TableCache:
+    def __init__(self, name: str):
+        self._data_name = f'{name}.npy'
+        self._meta_name = f'{name}.json'
+
+    def metadata(self) -> Optional[Dict]:
+        try:
+            with open(self._meta_name) as fp:
+                return loads(fp.read())
+        except (OSError, ValueError):
+            return None
+
+    # whether cache exists, has current schema and (if max_age is given) is not older than max_age seconds
+    def is_fresh(self, max_age: float = None) -> bool:
+        if np is None:
+            return False
+        meta = self.metadata()
+        if meta is None or meta.get('schema_version') != SCHEMA_VERSION:
+            return False
+        return max_age is None or time() - meta.get('created_at', 0) <= max_age
+
+    # extra metadata (e.g. HTTP validators of the source page) is stored along with the table
+    def save(self, table: Iterable[Dict], extra: Dict = None):
+        _require_numpy()
+        table = list(table)
+        dtype = []
+        for key, kind in COLUMNS:
+            if kind == 'str':
+                # fixed width strings are needed for memory mapping, so width is the longest value
+                dtype.append((key, f'U{max((len(row[key]) for row in table), default=1) or 1}'))
+            else:
+                dtype.append((key, np.int64 if kind == 'int' else np.bool_))
+        array = np.array([tuple(row[key] for key, _ in COLUMNS) for row in table], dtype=dtype)
+        # write data before metadata, so that metadata never describes a half-written array
+        with open(self._data_name + '.tmp', 'wb') as fp:
+            np.save(fp, array, allow_pickle=False)
+        replace(self._data_name + '.tmp', self._data_name)
+        self._save_metadata(len(array), extra)
+
+    # update cache to a new version of the table given the change set between the cached version and it.
+    # If only some rows were modified and their values fit into the string widths of the cached array,
+    # these rows are patched in place in the memory-mapped file; otherwise the table is saved anew
+    def patch(self, table: Iterable[Dict], changes, extra: Dict = None):
+        _require_numpy()
+        if changes.added or changes.removed:
+            self.save(table, extra)
+            return
+        array = np.load(self._data_name, mmap_mode='r+', allow_pickle=False)
+        # numpy stores unicode strings with 4 bytes per character
+        fits = all(len(row[key]) <= array.dtype[key].itemsize // 4
+                   for row in changes.modified for key, kind in COLUMNS if kind == 'str')
+        if not fits:
+            del array
+            self.save(table, extra)
+            return
+        index = {int(number): position for position, number in enumerate(array['number'])}
+        for row in changes.modified:
+            array[index[row['number']]] = tuple(row[key] for key, _ in COLUMNS)
+        array.flush()
+        rows = len(array)
+        del array
+        self._save_metadata(rows, extra)
+
+    def _save_metadata(self, rows: int, extra: Dict = None):
+        meta = dict(extra or {})
+        meta.update(schema_version=SCHEMA_VERSION, created_at=time(), rows=rows)
+        with open(self._meta_name + '.tmp', 'w') as fp:
+            fp.write(dumps(meta))
+        replace(self._meta_name + '.tmp', self._meta_name)
+
+    def load(self) -> 'np.ndarray':
+        _require_numpy()
+        return np.load(self._data_name, mmap_mode='r', allow_pickle=False)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('TableCache requires numpy')